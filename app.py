@@ -1,19 +1,633 @@
-from flask import Flask, request, jsonify, send_file, Response
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
 from io import BytesIO
+import json
 import os
+import threading
 
 app = Flask(__name__)
 CORS(app)
 
 # SUPABASE CONNECTION
+import httpx
+from postgrest import APIError
+from postgrest.utils import SyncClient
 from supabase import create_client
 
-def get_db():
+DB_POOL_SIZE = int(os.environ.get("SUPABASE_POOL_SIZE", "10"))
+DB_POOL_IDLE_TIMEOUT = float(os.environ.get("SUPABASE_POOL_IDLE_TIMEOUT", "60"))
+
+_db = None
+_db_lock = threading.Lock()
+_db_stats_lock = threading.Lock()
+db_pool_stats = {"requests": 0, "connections_opened": 0}
+
+def _count_db_connection(event_name, info):
+    # httpcore trace hook: fires only when the pool has to open a new
+    # connection, so requests - connections_opened is the reuse count.
+    if event_name == "connection.connect_tcp.complete":
+        with _db_stats_lock:
+            db_pool_stats["connections_opened"] += 1
+
+def _count_db_request(req):
+    with _db_stats_lock:
+        db_pool_stats["requests"] += 1
+    req.extensions["trace"] = _count_db_connection
+
+def _create_db():
     url = os.environ.get("SUPABASE_URL", "")
     key = os.environ.get("SUPABASE_KEY", "")
-    return create_client(url, key)
+    client = create_client(url, key)
+    # Swap the PostgREST session for one with a bounded keep-alive pool so
+    # every request reuses warm connections instead of a fresh TLS handshake.
+    rest = client.postgrest
+    session = rest.session
+    rest.session = SyncClient(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=session.timeout,
+        follow_redirects=True,
+        http2=True,
+        limits=httpx.Limits(max_connections=DB_POOL_SIZE,
+                            max_keepalive_connections=DB_POOL_SIZE,
+                            keepalive_expiry=DB_POOL_IDLE_TIMEOUT),
+        event_hooks={"request": [_count_db_request]},
+    )
+    session.close()
+    return client
+
+def get_db():
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = _create_db()
+        return _db
+
+# COLUMN PROJECTION
+TRIP_COLUMNS = ("id", "name", "budget", "status", "created_at")
+EXPENSE_COLUMNS = ("id", "trip_id", "date", "time", "category", "amount", "person", "description", "image", "created_at")
+EXPENSE_LIST_FIELDS = ("id", "trip_id", "date", "time", "category", "amount", "person", "description", "image")
+EXPENSE_SUMMARY_FIELDS = ("category", "amount", "person")
+EXPENSE_EXPORT_FIELDS = ("date", "time", "category", "amount", "person", "description")
+EXPENSE_STREAM_FIELDS = ("id", "trip_id", "date", "time", "category", "amount", "person", "description", "created_at")
+
+def select_fields(default, allowed):
+    fields = request.args.get("fields")
+    if not fields:
+        return ",".join(default)
+    columns = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [c for c in columns if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return ",".join(columns)
+
+# PAGINATION
+import base64
+
+EXPENSE_PAGE_SIZE = int(os.environ.get("EXPENSE_PAGE_SIZE", "500"))
+EXPENSE_MAX_PAGE_SIZE = 1000
+CURSOR_COLUMNS = ("created_at", "id")
+
+def encode_cursor(row):
+    raw = json.dumps([row["created_at"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        # Both values end up inside a PostgREST filter string, so anything
+        # but an ISO timestamp and an integer id is rejected here.
+        datetime.fromisoformat(created_at)
+        if type(row_id) is not int:
+            raise ValueError
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    return {"created_at": created_at, "id": row_id}
+
+def page_limit(default=EXPENSE_PAGE_SIZE):
+    limit = request.args.get("limit", default, type=int)
+    if limit is None or not 1 <= limit <= EXPENSE_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {EXPENSE_MAX_PAGE_SIZE}")
+    return limit
+
+def fetch_expense_page(db, columns, trip_id=None, after=None, limit=EXPENSE_PAGE_SIZE, trip_ids=None, date_range=None):
+    # Keyset pagination on (created_at, id); the cursor columns are fetched
+    # even when not requested so the next page can always be addressed.
+    requested = columns.split(",")
+    extra = [c for c in CURSOR_COLUMNS if c not in requested]
+    query = db.table("expenses").select(",".join(requested + extra))
+    if trip_id:
+        query = query.eq("trip_id", trip_id)
+    if trip_ids:
+        query = query.in_("trip_id", trip_ids)
+    if date_range and date_range[0]:
+        query = query.gte("date", date_range[0])
+    if date_range and date_range[1]:
+        query = query.lte("date", date_range[1])
+    if after:
+        created_at, row_id = after["created_at"], after["id"]
+        query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt."{row_id}")')
+    rows = query.order("created_at").order("id").limit(limit).execute().data
+    next_cursor = encode_cursor(rows[-1]) if len(rows) == limit else None
+    if extra:
+        for row in rows:
+            for c in extra:
+                del row[c]
+    return rows, next_cursor
+
+def iter_expense_pages(db, columns, trip_id=None, after=None, page_size=EXPENSE_PAGE_SIZE, trip_ids=None, date_range=None):
+    while True:
+        rows, next_cursor = fetch_expense_page(db, columns, trip_id, after, page_size, trip_ids, date_range)
+        if rows:
+            yield rows
+        if next_cursor is None:
+            return
+        after = decode_cursor(next_cursor)
+
+# READ CACHE
+import time
+from collections import OrderedDict, deque
+
+CACHE_URL = os.environ.get("CACHE_URL", "")
+CACHE_TTL = int(os.environ.get("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+class MemoryCache:
+    shared = False
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def info(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._entries), "bytes": self._bytes,
+                    "max_entries": self.max_entries, "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+class RedisCache:
+    shared = True
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=ttl)
+
+    def incr(self, key):
+        return self._client.incr(key)
+
+    def counter(self, key):
+        return int(self._client.get(key) or 0)
+
+    def info(self):
+        stats = self._client.info("stats")
+        return {"backend": "redis", "evictions": stats.get("evicted_keys", 0)}
+
+read_cache_stats = {"hits": 0, "misses": 0}
+_read_cache = None
+_read_cache_lock = threading.Lock()
+
+def get_read_cache():
+    global _read_cache
+    with _read_cache_lock:
+        if _read_cache is None:
+            if CACHE_URL.startswith(("redis://", "rediss://", "unix://")):
+                try:
+                    _read_cache = RedisCache(CACHE_URL)
+                except ImportError:
+                    # redis is optional and not in requirements.txt.
+                    app.logger.warning("CACHE_URL is set but the redis package is not installed; "
+                                       "using the in-process cache")
+                    _read_cache = MemoryCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+            else:
+                _read_cache = MemoryCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+        return _read_cache
+
+# VERSIONING
+import hashlib
+import uuid
+
+# Per-scope write counters behind the ETags and read-cache keys. A bump makes
+# every cached response and tag for that scope unreachable.
+# With a shared cache backend (Redis) its counters are the versions, so a
+# conditional GET or cache hit never reaches Supabase; every write through
+# the app bumps them. Otherwise the data_versions table, bumped by triggers
+# on trips and expenses, is the source: each instance memoizes what it read
+# for VERSION_TTL seconds, so a write handled by another instance can go
+# unseen here for up to that long. This instance's own writes drop the
+# memoized entries at once. With neither there is no version all instances
+# agree on, so responses go out untagged and uncached.
+VERSION_TTL = float(os.environ.get("VERSION_TTL", "2"))
+TRIPS_SCOPE = "trips"
+EXPENSES_SCOPE = "expenses"
+_versions_table_available = True
+_version_memo = {}
+_version_memo_lock = threading.Lock()
+
+def trip_scope(trip_id):
+    return f"trip:{trip_id}"
+
+def fetch_db_versions(scopes):
+    global _versions_table_available
+    now = time.monotonic()
+    with _version_memo_lock:
+        memo = {s: _version_memo[s] for s in scopes if s in _version_memo}
+    versions = {s: v for s, (expires_at, v) in memo.items() if expires_at > now}
+    missing = [s for s in scopes if s not in versions]
+    if missing:
+        try:
+            rows = get_db().table("data_versions").select("scope,version").in_("scope", missing).execute().data
+        except APIError as e:
+            # The data_versions migration has not been applied.
+            if e.code not in MISSING_RELATION_CODES:
+                raise
+            _versions_table_available = False
+            return None
+        fetched = {s: 0 for s in missing}
+        fetched.update((r["scope"], r["version"]) for r in rows)
+        versions.update(fetched)
+        if VERSION_TTL > 0:
+            with _version_memo_lock:
+                for scope, version in fetched.items():
+                    _version_memo[scope] = (now + VERSION_TTL, version)
+    return versions
+
+def version_token(*scopes):
+    scopes = list(dict.fromkeys(scopes))
+    cache = get_read_cache()
+    if cache.shared:
+        try:
+            return "cache:" + ",".join(f"{scope}={cache.counter(f'version:{scope}')}" for scope in scopes)
+        except Exception as e:
+            app.logger.warning("Could not read versions from the cache: %s", e)
+    if _versions_table_available:
+        versions = fetch_db_versions(scopes)
+        if versions is not None:
+            return "db:" + ",".join(f"{scope}={versions[scope]}" for scope in scopes)
+    return None
+
+def bump_versions(*scopes):
+    # The database side is bumped by the data_versions triggers; here the
+    # shared counters are bumped and this instance's memo is dropped.
+    scopes = set(scopes)
+    with _version_memo_lock:
+        for scope in scopes:
+            _version_memo.pop(scope, None)
+    cache = get_read_cache()
+    if cache.shared:
+        try:
+            for scope in scopes:
+                cache.incr(f"version:{scope}")
+        except Exception as e:
+            # The write itself has already succeeded.
+            app.logger.warning("Could not bump versions %s: %s", ", ".join(scopes), e)
+
+def make_etag(scope, variant="json"):
+    # The query string is part of the tag so each projection/page validates
+    # separately; variant names the representation when Accept can pick it.
+    token = version_token(scope)
+    if token is None:
+        return None
+    raw = f"{token}:{variant}:{request.path}?{request.query_string.decode()}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+def not_modified(etag):
+    if etag and request.if_none_match.contains_weak(etag):
+        return tag_response(Response(status=304), etag)
+    return None
+
+def tag_response(response, etag):
+    if etag:
+        response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def cached_json(scope, build):
+    etag = make_etag(scope)
+    if etag is None:
+        read_cache_stats["misses"] += 1
+        return tag_response(Response(app.json.dumps(build()), mimetype="application/json"), None)
+    response = not_modified(etag)
+    if response:
+        return response
+    cache = get_read_cache()
+    key = f"response:{etag}"
+    try:
+        body = cache.get(key)
+    except Exception:
+        body = None
+    if body is None:
+        read_cache_stats["misses"] += 1
+        body = app.json.dumps(build()).encode()
+        try:
+            cache.set(key, body, CACHE_TTL)
+        except Exception:
+            pass
+    else:
+        read_cache_stats["hits"] += 1
+    return tag_response(Response(body, mimetype="application/json"), etag)
+
+# RECEIPT STORE
+import re
+import shutil
+import tempfile
+
+# The local backend keeps the only copy of each receipt, so it defaults to
+# the app's instance folder rather than a temp dir that is wiped on reboot.
+# Vercel (which sets VERCEL) has no persistent, writable disk, so receipts
+# go to Supabase Storage there unless RECEIPT_BACKEND says otherwise.
+RECEIPT_BACKEND = os.environ.get("RECEIPT_BACKEND", "supabase" if os.environ.get("VERCEL") else "local")
+RECEIPT_DIR = os.environ.get("RECEIPT_DIR", os.path.join(app.instance_path, "receipts"))
+RECEIPT_BUCKET = os.environ.get("RECEIPT_BUCKET", "receipts")
+RECEIPT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+RECEIPT_MAX_DIMENSION = int(os.environ.get("RECEIPT_MAX_DIMENSION", "1600"))
+RECEIPT_QUALITY = float(os.environ.get("RECEIPT_QUALITY", "0.8"))
+RECEIPT_MAX_BYTES = int(os.environ.get("RECEIPT_MAX_BYTES", str(1024 * 1024)))
+RECEIPT_CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZE = int(os.environ.get("THUMBNAIL_SIZE", "160"))
+RECEIPT_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+def sniff_image_type(data):
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"GIF8"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+class LocalReceiptStore:
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _thumbnail_path(self, digest):
+        return os.path.join(self.root, "thumbs", digest[:2], digest)
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def put_file(self, src, digest, content_type):
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            os.close(fd)
+            shutil.move(src, tmp_path)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest):
+        try:
+            with open(self._path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_thumbnail(self, digest, data):
+        path = self._thumbnail_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get_thumbnail(self, digest):
+        try:
+            with open(self._thumbnail_path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, digests):
+        for digest in digests:
+            for path in (self._path(digest), self._thumbnail_path(digest)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+class SupabaseReceiptStore:
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        bucket = get_db().storage.from_(self.bucket)
+        try:
+            bucket.upload(digest, data, {"content-type": sniff_image_type(data)})
+        except Exception:
+            # Content-addressed, so an existing object already holds these bytes.
+            if self.get(digest) is None:
+                raise
+        return digest
+
+    def put_file(self, src, digest, content_type):
+        bucket = get_db().storage.from_(self.bucket)
+        try:
+            bucket.upload(digest, src, {"content-type": content_type})
+        except Exception:
+            if self.get(digest) is None:
+                raise
+        return digest
+
+    def get(self, digest):
+        try:
+            return get_db().storage.from_(self.bucket).download(digest)
+        except Exception:
+            return None
+
+    def put_thumbnail(self, digest, data):
+        get_db().storage.from_(self.bucket).upload(f"thumbs/{digest}", data,
+                                                   {"content-type": "image/jpeg", "upsert": "true"})
+
+    def get_thumbnail(self, digest):
+        return self.get(f"thumbs/{digest}")
+
+    def delete(self, digests):
+        if digests:
+            get_db().storage.from_(self.bucket).remove(list(digests) + [f"thumbs/{d}" for d in digests])
+
+_receipt_store = None
+
+def receipt_store_is_temporary():
+    if RECEIPT_BACKEND == "supabase":
+        return False
+    root = os.path.realpath(RECEIPT_DIR)
+    temp = os.path.realpath(tempfile.gettempdir())
+    return root == temp or root.startswith(temp + os.sep)
+
+def get_receipt_store():
+    global _receipt_store
+    if _receipt_store is None:
+        if RECEIPT_BACKEND == "supabase":
+            _receipt_store = SupabaseReceiptStore(RECEIPT_BUCKET)
+        else:
+            _receipt_store = LocalReceiptStore(RECEIPT_DIR)
+    return _receipt_store
+
+class ReceiptTooLarge(ValueError):
+    pass
+
+def fit_receipt(data):
+    # The frontend already downscales; this catches clients that don't.
+    if len(data) <= RECEIPT_MAX_BYTES:
+        return data
+    return reencode_receipt(BytesIO(data))
+
+def reencode_receipt(source):
+    try:
+        from PIL import Image
+        with Image.open(source) as img:
+            img.thumbnail((RECEIPT_MAX_DIMENSION, RECEIPT_MAX_DIMENSION))
+            output = BytesIO()
+            img.convert("RGB").save(output, "JPEG", quality=int(RECEIPT_QUALITY * 100), optimize=True)
+    except (ImportError, OSError):
+        raise ReceiptTooLarge(f"Receipt image exceeds {RECEIPT_MAX_BYTES} bytes")
+    except Image.DecompressionBombError:
+        raise ReceiptTooLarge("Receipt image has too many pixels")
+    if output.tell() > RECEIPT_MAX_BYTES:
+        raise ReceiptTooLarge(f"Receipt image exceeds {RECEIPT_MAX_BYTES} bytes")
+    return output.getvalue()
+
+def make_thumbnail(source):
+    from PIL import Image
+    try:
+        with Image.open(source) as img:
+            img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            output = BytesIO()
+            img.convert("RGB").save(output, "JPEG", quality=70, optimize=True)
+    except Image.DecompressionBombError:
+        raise ReceiptTooLarge("Receipt image has too many pixels")
+    return output.getvalue()
+
+def upload_thumbnail(source):
+    # Built before the receipt is stored. A failed thumbnail never fails the
+    # upload (the endpoint retries lazily), but a decompression bomb is
+    # rejected with ReceiptTooLarge before anything is written.
+    try:
+        return make_thumbnail(source)
+    except (ImportError, OSError) as e:
+        app.logger.warning("Could not thumbnail receipt: %s", e)
+        return None
+
+def save_thumbnail(digest, source):
+    try:
+        data = make_thumbnail(source)
+    except (ImportError, OSError, ReceiptTooLarge) as e:
+        app.logger.warning("Could not thumbnail receipt %s: %s", digest, e)
+        return None
+    get_receipt_store().put_thumbnail(digest, data)
+    return data
+
+def put_receipt(data, thumbnail):
+    store = get_receipt_store()
+    digest = store.put(data)
+    if thumbnail is not None:
+        store.put_thumbnail(digest, thumbnail)
+    return digest
+
+def store_receipt(image):
+    if not image:
+        return ""
+    if not isinstance(image, str):
+        raise ValueError("Receipt image must be a base64 data URL")
+    if RECEIPT_HASH_RE.match(image):
+        return image
+    header, _, payload = image.partition(",")
+    if not header.startswith("data:") or not header.endswith(";base64"):
+        raise ValueError("Receipt image must be a base64 data URL")
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except ValueError:
+        raise ValueError("Receipt image is not valid base64")
+    if not sniff_image_type(data).startswith("image/"):
+        raise ValueError("Receipt must be a JPEG, PNG, GIF or WebP image")
+    data = fit_receipt(data)
+    return put_receipt(data, upload_thumbnail(BytesIO(data)))
+
+def store_receipt_file(stream):
+    # Hash while spooling to disk in fixed-size chunks, so an upload is never
+    # held in memory whole; only oversized images are decoded for re-encoding.
+    hasher = hashlib.sha256()
+    head = b""
+    size = 0
+    fd, tmp_path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: stream.read(RECEIPT_CHUNK_SIZE), b""):
+                if len(head) < 12:
+                    head += chunk[:12 - len(head)]
+                hasher.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        if size == 0:
+            return ""
+        content_type = sniff_image_type(head)
+        if not content_type.startswith("image/"):
+            raise ValueError("Receipt must be a JPEG, PNG, GIF or WebP image")
+        if size > RECEIPT_MAX_BYTES:
+            data = reencode_receipt(tmp_path)
+            return put_receipt(data, upload_thumbnail(BytesIO(data)))
+        thumbnail = upload_thumbnail(tmp_path)
+        store = get_receipt_store()
+        digest = store.put_file(tmp_path, hasher.hexdigest(), content_type)
+        if thumbnail is not None:
+            store.put_thumbnail(digest, thumbnail)
+        return digest
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 # SERVE FRONTEND
 HTML_CONTENT = """<!DOCTYPE html>
@@ -488,6 +1102,15 @@ HTML_CONTENT = """<!DOCTYPE html>
             background: var(--light);
         }
 
+        .receipt-thumb {
+            width: 48px;
+            height: 48px;
+            object-fit: cover;
+            border-radius: 6px;
+            background: #e2e8f0;
+            cursor: pointer;
+        }
+
         .delete-expense-btn {
             background: var(--danger);
             color: white;
@@ -674,6 +1297,10 @@ HTML_CONTENT = """<!DOCTYPE html>
                         <p>No trips yet. Create your first trip to get started!</p>
                     </div>
                 </div>
+                <details id="trashSection" style="display: none; margin-top: 15px;">
+                    <summary style="cursor: pointer; font-weight: 600;">🗑️ Trash (<span id="trashCount">0</span>)</summary>
+                    <div class="trip-list" id="trashList" style="margin-top: 10px;"></div>
+                </details>
             </div>
 
             <!-- Main Content -->
@@ -762,7 +1389,6 @@ HTML_CONTENT = """<!DOCTYPE html>
                                 <input type="file" id="expenseImage" accept="image/*" onchange="previewImage(this)">
                                 <button class="camera-btn" onclick="capturePhoto()">📷 Take Photo</button>
                                 <img id="imagePreview" class="image-preview" alt="Preview">
-                                <input type="hidden" id="imageData">
                             </div>
                             <button class="btn-add" onclick="addExpense()" style="margin-top: 28px;">Add Expense</button>
                         </div>
@@ -834,24 +1460,78 @@ HTML_CONTENT = """<!DOCTYPE html>
 
     <script>
         const API_URL = '/api';
+        const EXPENSE_PAGE_SIZE = 100;
         let currentTripId = null;
         let currentTrip = null;
+        let currentExpenses = [];
+        let currentPersons = null;
+        let nextExpenseCursor = null;
+
+        // GET with If-None-Match; a 304 reuses the last body seen for that URL
+        const etagCache = new Map();
+        async function cachedFetch(url) {
+            const cached = etagCache.get(url);
+            const response = await fetch(url, {
+                cache: 'no-store',
+                headers: cached ? { 'If-None-Match': cached.etag } : {}
+            });
+            if (response.status === 304 && cached) {
+                return cached.data;
+            }
+            const data = await response.json();
+            const etag = response.headers.get('ETag');
+            if (response.ok && etag) {
+                etagCache.set(url, { etag, data });
+            }
+            return data;
+        }
 
         // Image handling
-        function previewImage(input) {
+        const RECEIPT_MAX_DIMENSION = __RECEIPT_MAX_DIMENSION__;
+        const RECEIPT_QUALITY = __RECEIPT_QUALITY__;
+
+        let receiptBlob = null;
+
+        // Downscale to RECEIPT_MAX_DIMENSION and re-encode as WebP (JPEG where unsupported)
+        function compressImage(source, width, height) {
+            const scale = Math.min(1, RECEIPT_MAX_DIMENSION / Math.max(width, height));
+            const canvas = document.createElement('canvas');
+            canvas.width = Math.round(width * scale);
+            canvas.height = Math.round(height * scale);
+            canvas.getContext('2d').drawImage(source, 0, 0, canvas.width, canvas.height);
+
+            return new Promise(resolve => {
+                canvas.toBlob(webp => {
+                    if (webp && webp.type === 'image/webp') {
+                        resolve(webp);
+                    } else {
+                        canvas.toBlob(resolve, 'image/jpeg', RECEIPT_QUALITY);
+                    }
+                }, 'image/webp', RECEIPT_QUALITY);
+            });
+        }
+
+        function setReceiptImage(blob) {
             const preview = document.getElementById('imagePreview');
-            const imageData = document.getElementById('imageData');
-            
+            if (preview.src.startsWith('blob:')) {
+                URL.revokeObjectURL(preview.src);
+            }
+            preview.src = URL.createObjectURL(blob);
+            preview.classList.add('active');
+            receiptBlob = blob;
+        }
+
+        function previewImage(input) {
             if (input.files && input.files[0]) {
-                const reader = new FileReader();
+                const url = URL.createObjectURL(input.files[0]);
+                const img = new Image();
                 
-                reader.onload = function(e) {
-                    preview.src = e.target.result;
-                    preview.classList.add('active');
-                    imageData.value = e.target.result;
+                img.onload = async function() {
+                    setReceiptImage(await compressImage(img, img.naturalWidth, img.naturalHeight));
+                    URL.revokeObjectURL(url);
                 };
                 
-                reader.readAsDataURL(input.files[0]);
+                img.src = url;
             }
         }
 
@@ -883,16 +1563,8 @@ HTML_CONTENT = """<!DOCTYPE html>
                 modal.appendChild(closeBtn);
                 document.body.appendChild(modal);
                 
-                captureBtn.onclick = function() {
-                    const canvas = document.createElement('canvas');
-                    canvas.width = video.videoWidth;
-                    canvas.height = video.videoHeight;
-                    canvas.getContext('2d').drawImage(video, 0, 0);
-                    
-                    const imageDataUrl = canvas.toDataURL('image/jpeg');
-                    document.getElementById('imagePreview').src = imageDataUrl;
-                    document.getElementById('imagePreview').classList.add('active');
-                    document.getElementById('imageData').value = imageDataUrl;
+                captureBtn.onclick = async function() {
+                    setReceiptImage(await compressImage(video, video.videoWidth, video.videoHeight));
                     
                     stream.getTracks().forEach(track => track.stop());
                     document.body.removeChild(modal);
@@ -912,6 +1584,7 @@ HTML_CONTENT = """<!DOCTYPE html>
         // Load trips on page load
         window.onload = function() {
             loadTrips();
+            loadTrash();
             loadPersonSuggestions();
         };
 
@@ -1024,8 +1697,7 @@ HTML_CONTENT = """<!DOCTYPE html>
         // Load Trips
         async function loadTrips() {
             try {
-                const response = await fetch(`${API_URL}/trips`);
-                const trips = await response.json();
+                const trips = await cachedFetch(`${API_URL}/trips`);
 
                 const tripList = document.getElementById('tripList');
                 
@@ -1047,6 +1719,41 @@ HTML_CONTENT = """<!DOCTYPE html>
             }
         }
 
+        // Load Trash
+        async function loadTrash() {
+            try {
+                const trips = await cachedFetch(`${API_URL}/trips?trash=1`);
+                if (!Array.isArray(trips)) return;
+
+                document.getElementById('trashSection').style.display = trips.length ? 'block' : 'none';
+                document.getElementById('trashCount').textContent = trips.length;
+                document.getElementById('trashList').innerHTML = trips.map(trip => `
+                    <div class="trip-card completed" style="cursor: default;">
+                        <h3>${trip.name}</h3>
+                        <button class="btn" onclick="restoreTrip('${trip.id}')" style="padding: 6px 14px; font-size: 0.9em;">↩️ Restore</button>
+                    </div>
+                `).join('');
+            } catch (error) {
+                console.error('Error loading trash:', error);
+            }
+        }
+
+        // Restore Trip from Trash
+        async function restoreTrip(tripId) {
+            try {
+                const response = await fetch(`${API_URL}/trips/${tripId}/restore`, { method: 'POST' });
+                if (!response.ok) {
+                    const body = await response.json().catch(() => ({}));
+                    alert(`Failed to restore trip: ${body.error || response.statusText}`);
+                    return;
+                }
+                loadTrips();
+                loadTrash();
+            } catch (error) {
+                console.error('Error restoring trip:', error);
+            }
+        }
+
         // Select Trip
         async function selectTrip(tripId) {
             currentTripId = tripId;
@@ -1054,120 +1761,180 @@ HTML_CONTENT = """<!DOCTYPE html>
             document.getElementById('tripDetails').style.display = 'block';
             
             loadTrips();
-            loadTripSummary(tripId);
-            loadExpenses(tripId);
+            loadDashboard(tripId);
+        }
+
+        // Load trip, summary and first page of expenses in one request
+        async function loadDashboard(tripId) {
+            try {
+                const dashboard = await cachedFetch(`${API_URL}/trips/${tripId}/dashboard`);
+
+                renderSummary(dashboard);
+                currentExpenses = dashboard.expenses;
+                nextExpenseCursor = dashboard.next_cursor;
+                currentPersons = dashboard.persons;
+                renderExpenses();
+            } catch (error) {
+                console.error('Error loading trip dashboard:', error);
+            }
         }
 
         // Load Trip Summary
         async function loadTripSummary(tripId) {
             try {
-                const response = await fetch(`${API_URL}/trips/${tripId}/summary`);
-                const summary = await response.json();
+                const summary = await cachedFetch(`${API_URL}/trips/${tripId}/summary`);
 
-                currentTrip = summary.trip;
-
-                document.getElementById('tripName').textContent = summary.trip.name;
-                document.getElementById('totalBudget').textContent = `₹${summary.total_budget.toLocaleString()}`;
-                document.getElementById('totalSpent').textContent = `₹${summary.total_spent.toLocaleString()}`;
-                document.getElementById('remaining').textContent = `₹${summary.remaining.toLocaleString()}`;
-                document.getElementById('expenseCount').textContent = `${summary.expense_count} expense${summary.expense_count !== 1 ? 's' : ''}`;
-                
-                // Update complete/reopen button
-                const completeBtn = document.getElementById('completeTripBtn');
-                if (summary.trip.status === 'completed') {
-                    completeBtn.textContent = 'Reopen Trip';
-                    completeBtn.classList.add('reopening');
-                } else {
-                    completeBtn.textContent = '✓ Complete Trip';
-                    completeBtn.classList.remove('reopening');
-                }
+                renderSummary(summary);
             } catch (error) {
                 console.error('Error loading trip summary:', error);
             }
         }
 
-        // Load Expenses
-        async function loadExpenses(tripId) {
+        function renderSummary(summary) {
+            currentTrip = summary.trip;
+
+            document.getElementById('tripName').textContent = summary.trip.name;
+            document.getElementById('totalBudget').textContent = `₹${summary.total_budget.toLocaleString()}`;
+            document.getElementById('totalSpent').textContent = `₹${summary.total_spent.toLocaleString()}`;
+            document.getElementById('remaining').textContent = `₹${summary.remaining.toLocaleString()}`;
+            document.getElementById('expenseCount').textContent = `${summary.expense_count} expense${summary.expense_count !== 1 ? 's' : ''}`;
+            
+            // Update complete/reopen button
+            const completeBtn = document.getElementById('completeTripBtn');
+            if (summary.trip.status === 'completed') {
+                completeBtn.textContent = 'Reopen Trip';
+                completeBtn.classList.add('reopening');
+            } else {
+                completeBtn.textContent = '✓ Complete Trip';
+                completeBtn.classList.remove('reopening');
+            }
+        }
+
+        // Load the next page of expenses
+        async function loadMoreExpenses() {
+            if (!nextExpenseCursor) return;
+
             try {
-                const response = await fetch(`${API_URL}/expenses?trip_id=${tripId}`);
-                const expenses = await response.json();
+                const page = await cachedFetch(`${API_URL}/expenses?trip_id=${currentTripId}&limit=${EXPENSE_PAGE_SIZE}&after=${nextExpenseCursor}`);
 
-                const container = document.getElementById('expenseTableContainer');
+                currentExpenses = currentExpenses.concat(page.data);
+                nextExpenseCursor = page.next_cursor;
+                renderExpenses();
+            } catch (error) {
+                console.error('Error loading expenses:', error);
+            }
+        }
 
-                if (expenses.length === 0) {
-                    container.innerHTML = '<div class="empty-state"><p>No expenses yet. Add your first expense above!</p></div>';
-                    document.getElementById('personBreakdown').style.display = 'none';
-                    return;
-                }
+        function renderExpenses() {
+            const expenses = currentExpenses;
+            const container = document.getElementById('expenseTableContainer');
+
+            if (expenses.length === 0) {
+                container.innerHTML = '<div class="empty-state"><p>No expenses yet. Add your first expense above!</p></div>';
+                document.getElementById('personBreakdown').style.display = 'none';
+                return;
+            }
 
-                // Calculate person-wise breakdown
-                const personTotals = {};
+            // Person-wise breakdown covers the whole trip, not just the loaded page
+            const personTotals = {};
+            if (currentPersons) {
+                Object.entries(currentPersons).forEach(([name, totals]) => {
+                    const person = name || 'Unknown';
+                    if (!personTotals[person]) {
+                        personTotals[person] = { total: 0, count: 0 };
+                    }
+                    personTotals[person].total += totals.total;
+                    personTotals[person].count += totals.count;
+                });
+            } else {
                 expenses.forEach(expense => {
                     const person = expense.person || 'Unknown';
                     if (!personTotals[person]) {
-                        personTotals[person] = 0;
+                        personTotals[person] = { total: 0, count: 0 };
                     }
-                    personTotals[person] += parseFloat(expense.amount);
+                    personTotals[person].total += parseFloat(expense.amount);
+                    personTotals[person].count += 1;
                 });
+            }
 
-                // Display person breakdown
-                const breakdownContainer = document.getElementById('personBreakdownContent');
-                const personBreakdownHTML = Object.entries(personTotals).map(([person, total]) => `
-                    <div style="background: white; padding: 15px; border-radius: 10px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);">
-                        <div style="font-size: 0.9em; color: #64748b; margin-bottom: 5px;">${person}</div>
-                        <div style="font-size: 1.5em; font-weight: 700; color: #667eea;">₹${total.toLocaleString()}</div>
-                        <div style="font-size: 0.8em; color: #64748b; margin-top: 5px;">
-                            ${expenses.filter(e => (e.person || 'Unknown') === person).length} expense${expenses.filter(e => (e.person || 'Unknown') === person).length !== 1 ? 's' : ''}
-                        </div>
+            // Display person breakdown
+            const breakdownContainer = document.getElementById('personBreakdownContent');
+            const personBreakdownHTML = Object.entries(personTotals).map(([person, totals]) => `
+                <div style="background: white; padding: 15px; border-radius: 10px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);">
+                    <div style="font-size: 0.9em; color: #64748b; margin-bottom: 5px;">${person}</div>
+                    <div style="font-size: 1.5em; font-weight: 700; color: #667eea;">₹${totals.total.toLocaleString()}</div>
+                    <div style="font-size: 0.8em; color: #64748b; margin-top: 5px;">
+                        ${totals.count} expense${totals.count !== 1 ? 's' : ''}
                     </div>
-                `).join('');
-                
-                breakdownContainer.innerHTML = personBreakdownHTML;
-                document.getElementById('personBreakdown').style.display = 'block';
-
-                let tableHTML = `
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>Date</th>
-                                <th>Category</th>
-                                <th>Amount</th>
-                                <th>Person</th>
-                                <th>Description</th>
-                                <th>Receipt</th>
-                                <th>Action</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                `;
+                </div>
+            `).join('');
+            
+            breakdownContainer.innerHTML = personBreakdownHTML;
+            document.getElementById('personBreakdown').style.display = 'block';
 
-                expenses.forEach(expense => {
-                    const receiptBtn = expense.image 
-                        ? `<button onclick="viewImage('${expense.image}')" style="background: #667eea; color: white; border: none; padding: 5px 10px; border-radius: 5px; cursor: pointer;">📷 View</button>`
-                        : '-';
-                    
-                    tableHTML += `
+            let tableHTML = `
+                <table>
+                    <thead>
                         <tr>
-                            <td>${expense.date}<br><small style="color: #64748b;">${expense.time}</small></td>
-                            <td>${expense.category}</td>
-                            <td><strong>₹${parseFloat(expense.amount).toLocaleString()}</strong></td>
-                            <td><strong style="color: #667eea;">${expense.person || '-'}</strong></td>
-                            <td>${expense.description || '-'}</td>
-                            <td>${receiptBtn}</td>
-                            <td>
-                                <button class="delete-expense-btn" onclick="deleteExpense('${expense.id}')">
-                                    Delete
-                                </button>
-                            </td>
+                            <th>Date</th>
+                            <th>Category</th>
+                            <th>Amount</th>
+                            <th>Person</th>
+                            <th>Description</th>
+                            <th>Receipt</th>
+                            <th>Action</th>
                         </tr>
-                    `;
-                });
+                    </thead>
+                    <tbody>
+            `;
+
+            expenses.forEach(expense => {
+                let receiptBtn = '-';
+                if (expense.image && expense.image.startsWith('data:')) {
+                    receiptBtn = `<button onclick="viewImage(currentExpenses.find(e => e.id == '${expense.id}').image)" style="background: #667eea; color: white; border: none; padding: 5px 10px; border-radius: 5px; cursor: pointer;">📷 View</button>`;
+                } else if (expense.image) {
+                    receiptBtn = `<img class="receipt-thumb" data-src="${API_URL}/receipts/${expense.image}/thumbnail" alt="Receipt" onclick="viewImage('${receiptUrl(expense.image)}')">`;
+                }
+                
+                tableHTML += `
+                    <tr>
+                        <td>${expense.date}<br><small style="color: #64748b;">${expense.time}</small></td>
+                        <td>${expense.category}</td>
+                        <td><strong>₹${parseFloat(expense.amount).toLocaleString()}</strong></td>
+                        <td><strong style="color: #667eea;">${expense.person || '-'}</strong></td>
+                        <td>${expense.description || '-'}</td>
+                        <td>${receiptBtn}</td>
+                        <td>
+                            <button class="delete-expense-btn" onclick="deleteExpense('${expense.id}')">
+                                Delete
+                            </button>
+                        </td>
+                    </tr>
+                `;
+            });
 
-                tableHTML += '</tbody></table>';
-                container.innerHTML = tableHTML;
-            } catch (error) {
-                console.error('Error loading expenses:', error);
+            tableHTML += '</tbody></table>';
+            if (nextExpenseCursor) {
+                tableHTML += '<button onclick="loadMoreExpenses()" style="margin-top: 15px; padding: 10px 20px; background: #667eea; color: white; border: none; border-radius: 8px; cursor: pointer;">Load more</button>';
             }
+            container.innerHTML = tableHTML;
+            container.querySelectorAll('img[data-src]').forEach(img => thumbnailObserver.observe(img));
+        }
+
+        // Receipt thumbnails are only fetched once their row scrolls into view
+        const thumbnailObserver = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    entry.target.src = entry.target.dataset.src;
+                    entry.target.removeAttribute('data-src');
+                    thumbnailObserver.unobserve(entry.target);
+                }
+            });
+        }, { rootMargin: '200px' });
+
+        // Receipts are stored by content hash; older rows may still hold a data URL
+        function receiptUrl(image) {
+            return image.startsWith('data:') ? image : `${API_URL}/receipts/${image}`;
         }
 
         // View uploaded image
@@ -1204,7 +1971,6 @@ HTML_CONTENT = """<!DOCTYPE html>
             const category = document.getElementById('expenseCategory').value;
             const person = document.getElementById('expensePerson').value.trim();
             const description = document.getElementById('expenseDescription').value.trim();
-            const imageData = document.getElementById('imageData').value;
 
             if (!amount || amount <= 0) {
                 alert('Please enter a valid amount');
@@ -1216,19 +1982,28 @@ HTML_CONTENT = """<!DOCTYPE html>
                 return;
             }
 
+            // Multipart keeps the receipt binary instead of base64 inside JSON
+            const form = new FormData();
+            form.append('trip_id', currentTripId);
+            form.append('amount', amount);
+            form.append('category', category);
+            form.append('person', person);
+            form.append('description', description);
+            if (receiptBlob) {
+                form.append('image', receiptBlob, 'receipt');
+            }
+
             try {
-                await fetch(`${API_URL}/expenses`, {
+                const response = await fetch(`${API_URL}/expenses`, {
                     method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        trip_id: currentTripId,
-                        amount,
-                        category,
-                        person,
-                        description,
-                        image: imageData
-                    })
+                    body: form
                 });
+                if (!response.ok) {
+                    // Keep the form filled so nothing is lost
+                    const body = await response.json().catch(() => ({}));
+                    alert(`Failed to add expense: ${body.error || response.statusText}`);
+                    return;
+                }
 
                 // Save person name for future suggestions
                 savePersonName(person);
@@ -1237,12 +2012,11 @@ HTML_CONTENT = """<!DOCTYPE html>
                 document.getElementById('expenseAmount').value = '';
                 document.getElementById('expenseDescription').value = '';
                 document.getElementById('expenseImage').value = '';
-                document.getElementById('imageData').value = '';
+                receiptBlob = null;
                 document.getElementById('imagePreview').classList.remove('active');
 
                 // Reload data
-                loadTripSummary(currentTripId);
-                loadExpenses(currentTripId);
+                loadDashboard(currentTripId);
             } catch (error) {
                 console.error('Error adding expense:', error);
                 alert('Failed to add expense');
@@ -1258,8 +2032,7 @@ HTML_CONTENT = """<!DOCTYPE html>
                     method: 'DELETE'
                 });
 
-                loadTripSummary(currentTripId);
-                loadExpenses(currentTripId);
+                loadDashboard(currentTripId);
             } catch (error) {
                 console.error('Error deleting expense:', error);
             }
@@ -1299,18 +2072,31 @@ HTML_CONTENT = """<!DOCTYPE html>
 
         // Delete Trip
         async function deleteTrip() {
-            if (!confirm('Are you sure you want to delete this trip and all its expenses?')) return;
+            if (!confirm('Move this trip to the trash? You can restore it from the Trash until it is purged.')) return;
 
             try {
-                await fetch(`${API_URL}/trips/${currentTripId}`, {
+                let response = await fetch(`${API_URL}/trips/${currentTripId}?mode=trash`, {
                     method: 'DELETE'
                 });
+                if (response.status === 501) {
+                    // This server has no trash yet, so deleting is permanent
+                    if (!confirm('The trash is not available on this server. Permanently delete this trip and all its expenses?')) return;
+                    response = await fetch(`${API_URL}/trips/${currentTripId}`, {
+                        method: 'DELETE'
+                    });
+                }
+                if (!response.ok) {
+                    const body = await response.json().catch(() => ({}));
+                    alert(`Failed to delete trip: ${body.error || response.statusText}`);
+                    return;
+                }
 
                 currentTripId = null;
                 currentTrip = null;
                 document.getElementById('noTripSelected').style.display = 'block';
                 document.getElementById('tripDetails').style.display = 'none';
                 loadTrips();
+                loadTrash();
             } catch (error) {
                 console.error('Error deleting trip:', error);
             }
@@ -1325,17 +2111,178 @@ HTML_CONTENT = """<!DOCTYPE html>
 </html>
 """
 
+# STATIC ASSETS
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def build_asset(body, mimetype):
+    raw = body.encode()
+    variants = {"identity": raw, "gzip": gzip.compress(raw, 9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(raw, quality=11)
+    return {"hash": hashlib.sha256(raw).hexdigest()[:16], "mimetype": mimetype, "variants": variants}
+
+def split_assets(html):
+    # Pull the inline CSS and JS out into content-hashed files so they can be
+    # cached forever, leaving a small page that is revalidated on each visit.
+    assets = {}
+    for tag, mimetype, ext, ref in (
+        ("style", "text/css", "css", '<link rel="stylesheet" href="/assets/{}">'),
+        ("script", "application/javascript", "js", '<script src="/assets/{}"></script>'),
+    ):
+        match = re.search(rf"<{tag}>(.*?)</{tag}>", html, re.S)
+        asset = build_asset(match.group(1), mimetype)
+        name = f"app.{asset['hash']}.{ext}"
+        assets[name] = asset
+        html = html.replace(match.group(0), ref.format(name))
+    return html, assets
+
+def asset_response(asset, cache_control):
+    variants = asset["variants"]
+    encoding = request.accept_encodings.best_match([e for e in ("br", "gzip") if e in variants] + ["identity"],
+                                                   default="identity")
+    etag = f"{asset['hash']}-{encoding}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(variants[encoding], mimetype=asset["mimetype"])
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    response.vary.add("Accept-Encoding")
+    return response
+
+INDEX_HTML, STATIC_ASSETS = split_assets(HTML_CONTENT
+                                          .replace("__RECEIPT_MAX_DIMENSION__", str(RECEIPT_MAX_DIMENSION))
+                                          .replace("__RECEIPT_QUALITY__", str(RECEIPT_QUALITY)))
+INDEX_ASSET = build_asset(INDEX_HTML, "text/html")
+
 @app.route("/")
 def serve_index():
-    return Response(HTML_CONTENT, mimetype="text/html")
+    return asset_response(INDEX_ASSET, "no-cache")
+
+@app.route("/assets/<name>")
+def serve_asset(name):
+    asset = STATIC_ASSETS.get(name)
+    if asset is None:
+        return jsonify({"error": "Asset not found"}), 404
+    return asset_response(asset, ASSET_CACHE_CONTROL)
+
+# METRICS
+def db_pool_info():
+    with _db_stats_lock:
+        stats = dict(db_pool_stats)
+    stats["connections_reused"] = max(stats["requests"] - stats["connections_opened"], 0)
+    return dict(stats, size=DB_POOL_SIZE, idle_timeout=DB_POOL_IDLE_TIMEOUT)
+
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    return jsonify({
+        "db_pool": db_pool_info(),
+        "read_cache": dict(read_cache_stats, ttl=CACHE_TTL, **get_read_cache().info()),
+        "export_cache": get_export_cache().info()
+    })
 
 # TRIPS
+from datetime import timedelta
+
+TRASH_RETENTION = int(os.environ.get("TRASH_RETENTION", str(7 * 24 * 3600)))
+CRON_SECRET = os.environ.get("CRON_SECRET", "")
+_delete_rpc_available = True
+_trash_available = True
+
+def missing_trash_column(e):
+    # Until the deleted_at column is deployed there is no trash: every trip is
+    # live. Filters on it fail with 42703 (undefined column), writes to it
+    # with PGRST204 (column not in the schema cache).
+    global _trash_available
+    if e.code in ("42703", "PGRST204"):
+        _trash_available = False
+        return True
+    return False
+
+def trash_unavailable():
+    return jsonify({"error": "Trash is not available; apply supabase/migrations first"}), 501
+
+def fetch_trip_list(db, columns, trashed=False):
+    if _trash_available:
+        try:
+            query = db.table("trips").select(columns).order("created_at")
+            query = query.not_.is_("deleted_at", "null") if trashed else query.is_("deleted_at", "null")
+            return query.execute().data
+        except APIError as e:
+            if not missing_trash_column(e):
+                raise
+    return [] if trashed else db.table("trips").select(columns).order("created_at").execute().data
+
+def purge_receipts(digests):
+    digests = [d for d in digests or [] if RECEIPT_HASH_RE.match(d or "")]
+    if digests:
+        try:
+            get_receipt_store().delete(digests)
+        except Exception as e:
+            app.logger.warning("Could not remove %d receipt(s): %s", len(digests), e)
+    return len(digests)
+
+def hard_delete_trip(db, trip_id):
+    # The delete_trip RPC removes the trip, its expenses and rollup in one
+    # transaction and reports the receipts nothing else refers to. Without
+    # it, fall back to the old per-table deletes.
+    global _delete_rpc_available
+    if _delete_rpc_available:
+        try:
+            return purge_receipts(db.rpc("delete_trip", {"p_trip_id": trip_id}).execute().data)
+        except APIError as e:
+            # PGRST202: the delete_trip function has not been deployed.
+            if e.code != "PGRST202":
+                raise
+            _delete_rpc_available = False
+    images = {e["image"] for e in db.table("expenses").select("image").eq("trip_id", trip_id).neq("image", "").execute().data}
+    db.table("expenses").delete().eq("trip_id", trip_id).execute()
+    db.table("trips").delete().eq("id", trip_id).execute()
+    return purge_orphaned_receipts(db, images)
+
+def purge_orphaned_receipts(db, images):
+    # Receipts are shared between expenses; only drop the ones no remaining
+    # expense refers to.
+    images = {i for i in images if i}
+    if images:
+        images -= {e["image"] for e in db.table("expenses").select("image").in_("image", list(images)).execute().data}
+    return purge_receipts(images)
+
+def purge_trash(db, retention=TRASH_RETENTION):
+    cutoff = (datetime.now() - timedelta(seconds=retention)).isoformat()
+    trips = db.table("trips").select("id").lt("deleted_at", cutoff).execute().data
+    receipts = sum(hard_delete_trip(db, t["id"]) for t in trips)
+    if trips:
+        bump_versions(TRIPS_SCOPE, EXPENSES_SCOPE, *(trip_scope(t["id"]) for t in trips))
+    return len(trips), receipts
+
 @app.route("/api/trips", methods=["GET"])
 def get_trips():
     try:
-        db = get_db()
-        result = db.table("trips").select("*").order("created_at").execute()
-        return jsonify(result.data)
+        columns = select_fields(TRIP_COLUMNS, TRIP_COLUMNS)
+        trashed = request.args.get("trash") in ("1", "true")
+        def build():
+            db = get_db()
+            trips = fetch_trip_list(db, columns, trashed)
+            if "fields" not in request.args:
+                rollups = {r["trip_id"]: r for r in fetch_rollups(db) or []}
+                for trip in trips:
+                    if trip["id"] in rollups:
+                        trip["total_spent"] = float(rollups[trip["id"]]["total"])
+                        trip["expense_count"] = rollups[trip["id"]]["expense_count"]
+            return trips
+        return cached_json(TRIPS_SCOPE, build)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1353,6 +2300,7 @@ def create_trip():
             "created_at": datetime.now().isoformat()
         }
         result = db.table("trips").insert(new_trip).execute()
+        bump_versions(TRIPS_SCOPE)
         return jsonify(result.data[0]), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1371,6 +2319,7 @@ def update_trip(trip_id):
             bv = data["budget"]
             update_data["budget"] = float(bv) if bv and str(bv).strip() else None
         result = db.table("trips").update(update_data).eq("id", trip_id).execute()
+        bump_versions(trip_scope(trip_id), TRIPS_SCOPE)
         return jsonify(result.data[0])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1379,9 +2328,53 @@ def update_trip(trip_id):
 def delete_trip(trip_id):
     try:
         db = get_db()
-        db.table("expenses").delete().eq("trip_id", trip_id).execute()
-        db.table("trips").delete().eq("id", trip_id).execute()
-        return jsonify({"message": "Trip deleted"})
+        if request.args.get("mode") == "trash":
+            if not _trash_available:
+                return trash_unavailable()
+            try:
+                trashed = db.table("trips").update({"deleted_at": datetime.now().isoformat()}).eq("id", trip_id).execute().data
+            except APIError as e:
+                if not missing_trash_column(e):
+                    raise
+                return trash_unavailable()
+            if not trashed:
+                return jsonify({"error": "Trip not found"}), 404
+            bump_versions(trip_scope(trip_id), TRIPS_SCOPE)
+            return jsonify({"message": "Trip moved to trash", "purge_after": TRASH_RETENTION})
+        receipts = hard_delete_trip(db, trip_id)
+        bump_versions(trip_scope(trip_id), TRIPS_SCOPE, EXPENSES_SCOPE)
+        return jsonify({"message": "Trip deleted", "receipts_removed": receipts})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/trips/<trip_id>/restore", methods=["POST"])
+def restore_trip(trip_id):
+    if not _trash_available:
+        return trash_unavailable()
+    try:
+        db = get_db()
+        try:
+            restored = db.table("trips").update({"deleted_at": None}).eq("id", trip_id).not_.is_("deleted_at", "null").execute().data
+        except APIError as e:
+            if not missing_trash_column(e):
+                raise
+            return trash_unavailable()
+        if not restored:
+            return jsonify({"error": "Trip is not in the trash"}), 404
+        bump_versions(trip_scope(trip_id), TRIPS_SCOPE)
+        return jsonify(restored[0])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/trash/purge", methods=["GET", "POST"])
+def purge_trash_route():
+    # Called by the Vercel cron in vercel.json, which sends CRON_SECRET as a
+    # bearer token; disabled when no secret is configured.
+    if not CRON_SECRET or request.headers.get("Authorization") != f"Bearer {CRON_SECRET}":
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        trips, receipts = purge_trash(get_db())
+        return jsonify({"purged_trips": trips, "receipts_removed": receipts})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1390,33 +2383,356 @@ def delete_trip(trip_id):
 def get_expenses():
     try:
         trip_id = request.args.get("trip_id")
-        db = get_db()
-        if trip_id:
-            result = db.table("expenses").select("*").eq("trip_id", trip_id).order("created_at").execute()
+        scope = trip_scope(trip_id) if trip_id else EXPENSES_SCOPE
+        columns = select_fields(EXPENSE_LIST_FIELDS, EXPENSE_COLUMNS)
+        after = decode_cursor(request.args["after"]) if request.args.get("after") else None
+        if request.args.get("format") == "ndjson" or request.accept_mimetypes.best == "application/x-ndjson":
+            etag = make_etag(scope, "ndjson")
+            response = not_modified(etag)
+            if response is None:
+                pages = iter_expense_pages(get_db(), columns, trip_id, after, page_limit())
+                def generate():
+                    for rows in pages:
+                        for row in rows:
+                            yield json.dumps(row) + "\n"
+                response = tag_response(Response(stream_with_context(generate()), mimetype="application/x-ndjson"), etag)
+        elif "limit" in request.args or after:
+            limit = page_limit()
+            def build_page():
+                rows, next_cursor = fetch_expense_page(get_db(), columns, trip_id, after, limit)
+                return {"data": rows, "next_cursor": next_cursor}
+            response = cached_json(scope, build_page)
         else:
-            result = db.table("expenses").select("*").order("created_at").execute()
-        return jsonify(result.data)
+            def build():
+                query = get_db().table("expenses").select(columns)
+                if trip_id:
+                    query = query.eq("trip_id", trip_id)
+                return query.order("created_at").order("id").execute().data
+            response = cached_json(scope, build)
+        # The same URL answers JSON or NDJSON depending on Accept.
+        response.vary.add("Accept")
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+EXPENSE_BULK_BATCH_SIZE = int(os.environ.get("EXPENSE_BULK_BATCH_SIZE", "500"))
+EXPENSE_BULK_MAX_BATCH_SIZE = 1000
+
+def build_expense(data):
+    if not hasattr(data, "get"):
+        raise ValueError("Each expense must be a JSON object")
+    if not data.get("trip_id"):
+        raise ValueError("trip_id is required")
+    try:
+        amount = float(data.get("amount"))
+    except (TypeError, ValueError):
+        raise ValueError("amount must be a number")
+    now = datetime.now()
+    date = data.get("date") or now.strftime("%Y-%m-%d")
+    time_of_day = data.get("time") or now.strftime("%H:%M:%S")
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+        datetime.strptime(time_of_day, "%H:%M:%S")
+    except (TypeError, ValueError):
+        raise ValueError("date must be YYYY-MM-DD and time HH:MM:SS")
+    return {
+        "trip_id": data.get("trip_id"),
+        "category": data.get("category"),
+        "amount": amount,
+        "description": data.get("description", ""),
+        "person": data.get("person", ""),
+        "image": "",
+        "date": date,
+        "time": time_of_day,
+        "created_at": now.isoformat()
+    }
+
+def insert_expenses(db, rows, batch_size=EXPENSE_BULK_BATCH_SIZE):
+    # Takes (index, row) pairs, validates each row as it arrives and inserts
+    # the valid ones batch_size at a time, yielding one result per input row.
+    # Memory is bounded by the batch.
+    batch = []
+    for index, data in rows:
+        try:
+            if isinstance(data, bytes):
+                data = json.loads(data)
+            expense = build_expense(data)
+            expense["image"] = store_receipt(data.get("image", ""))
+            batch.append((index, expense))
+        except ValueError as e:
+            yield {"index": index, "status": "error", "error": str(e)}
+            continue
+        if len(batch) >= batch_size:
+            yield from _insert_expense_batch(db, batch)
+            batch = []
+    if batch:
+        yield from _insert_expense_batch(db, batch)
+
+def _insert_expense_batch(db, batch):
+    # A failed batch, whether rejected by PostgREST or lost in transport,
+    # fails only its own rows; receipts stored for them are dropped unless
+    # something else refers to them.
+    try:
+        inserted = db.table("expenses").insert([expense for _, expense in batch]).execute().data
+    except (APIError, httpx.HTTPError) as e:
+        error = e.message or str(e) if isinstance(e, APIError) else f"Could not reach the database: {e}"
+        for index, _ in batch:
+            yield {"index": index, "status": "error", "error": error}
+        try:
+            purge_orphaned_receipts(db, {expense["image"] for _, expense in batch})
+        except Exception as e:
+            app.logger.warning("Could not clean up receipts of a failed batch: %s", e)
+        return
+    for (index, _), row in zip(batch, inserted):
+        yield {"index": index, "status": "created", "id": row["id"], "trip_id": row["trip_id"]}
+
 @app.route("/api/expenses", methods=["POST"])
 def add_expense():
     try:
-        data = request.json
+        # Validate the row before the receipt is written, so a rejected
+        # request leaves nothing behind in the receipt store.
+        if request.mimetype == "multipart/form-data":
+            new_expense = build_expense(request.form)
+            receipt = request.files.get("image")
+            new_expense["image"] = store_receipt_file(receipt.stream) if receipt else ""
+        else:
+            data = request.json
+            new_expense = build_expense(data)
+            new_expense["image"] = store_receipt(data.get("image", ""))
         db = get_db()
-        new_expense = {
-            "trip_id": data.get("trip_id"),
-            "category": data.get("category"),
-            "amount": float(data.get("amount")),
-            "description": data.get("description", ""),
-            "person": data.get("person", ""),
-            "image": data.get("image", ""),
-            "date": datetime.now().strftime("%Y-%m-%d"),
-            "time": datetime.now().strftime("%H:%M:%S"),
-            "created_at": datetime.now().isoformat()
-        }
         result = db.table("expenses").insert(new_expense).execute()
+        bump_versions(trip_scope(new_expense["trip_id"]), TRIPS_SCOPE, EXPENSES_SCOPE)
         return jsonify(result.data[0]), 201
+    except ReceiptTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/expenses/bulk", methods=["POST"])
+def add_expenses_bulk():
+    try:
+        batch_size = request.args.get("batch_size", EXPENSE_BULK_BATCH_SIZE, type=int)
+        if not 1 <= batch_size <= EXPENSE_BULK_MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {EXPENSE_BULK_MAX_BATCH_SIZE}")
+        if request.mimetype == "application/x-ndjson":
+            rows = (line for line in request.stream if line.strip())
+        else:
+            rows = request.get_json()
+            if not isinstance(rows, list):
+                raise ValueError("Expected a JSON array of expenses")
+        db = get_db()
+        results = []
+        trip_ids = set()
+        try:
+            for result in insert_expenses(db, enumerate(rows), batch_size):
+                if result["status"] == "created":
+                    trip_ids.add(result.pop("trip_id"))
+                results.append(result)
+        finally:
+            # Batches already committed stay committed if a later one fails.
+            if trip_ids:
+                bump_versions(TRIPS_SCOPE, EXPENSES_SCOPE, *(trip_scope(t) for t in trip_ids))
+        results.sort(key=lambda r: r["index"])
+        created = [r for r in results if r["status"] == "created"]
+        return jsonify({
+            "created": len(created),
+            "failed": len(results) - len(created),
+            "results": results
+        }), 201 if len(created) == len(results) else 207
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# IMPORT
+import csv
+import io
+import zipfile
+
+IMPORT_FIELDS = ("date", "time", "category", "amount", "person", "description")
+IMPORT_MAX_ERRORS = 100
+
+def import_cell(field, value):
+    if value is None:
+        return ""
+    if field == "date" and hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d")
+    if field == "time" and hasattr(value, "strftime"):
+        return value.strftime("%H:%M:%S")
+    if field == "amount" and isinstance(value, str):
+        return value.replace(",", "").replace("Rs.", "").strip()
+    return value.strip() if isinstance(value, str) else value
+
+def map_import_rows(rows):
+    # Rows before the Date/.../Amount header (the export's title banner) and
+    # rows without a date or amount (its totals block and footer) are skipped.
+    columns = None
+    for number, values in enumerate(rows, start=1):
+        if columns is None:
+            names = [str(v).strip().lower() if v is not None else "" for v in values]
+            if "date" in names and "amount" in names:
+                columns = {f: names.index(f) for f in IMPORT_FIELDS if f in names}
+            continue
+        data = {f: import_cell(f, values[i] if i < len(values) else None) for f, i in columns.items()}
+        if data.get("date") in ("", None) or data.get("amount") in ("", None):
+            continue
+        yield number, data
+    if columns is None:
+        raise ValueError("No header row with Date and Amount columns found")
+
+def read_import_file(upload):
+    name = (upload.filename or "").lower()
+    if name.endswith(".xlsx"):
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+        # A corrupt workbook can fail on open (bad zip, missing parts) or,
+        # in read-only mode, only once its sheet XML is parsed.
+        try:
+            workbook = load_workbook(upload.stream, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, InvalidFileException, KeyError, SyntaxError) as e:
+            raise ValueError(f"Not a readable .xlsx file: {e}")
+        try:
+            yield from map_import_rows(workbook.active.iter_rows(values_only=True))
+        except (zipfile.BadZipFile, KeyError, SyntaxError, EOFError) as e:
+            raise ValueError(f"Not a readable .xlsx file: {e}")
+        finally:
+            workbook.close()
+    else:
+        text = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        yield from map_import_rows(csv.reader(text))
+
+@app.route("/api/trips/<trip_id>/import", methods=["POST"])
+def import_expenses(trip_id):
+    try:
+        upload = request.files.get("file")
+        if upload is None or not (upload.filename or "").lower().endswith((".csv", ".xlsx")):
+            raise ValueError("Upload a .csv or .xlsx file in the 'file' field")
+        batch_size = request.args.get("batch_size", EXPENSE_BULK_BATCH_SIZE, type=int)
+        if not 1 <= batch_size <= EXPENSE_BULK_MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {EXPENSE_BULK_MAX_BATCH_SIZE}")
+        db = get_db()
+        if not db.table("trips").select("id").eq("id", trip_id).execute().data:
+            return jsonify({"error": "Trip not found"}), 404
+        rows = ((number, dict(data, trip_id=trip_id)) for number, data in read_import_file(upload))
+        created = failed = 0
+        errors = []
+        try:
+            for result in insert_expenses(db, rows, batch_size):
+                if result["status"] == "created":
+                    created += 1
+                    continue
+                failed += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({"row": result["index"], "error": result["error"]})
+        finally:
+            if created:
+                bump_versions(trip_scope(trip_id), TRIPS_SCOPE, EXPENSES_SCOPE)
+        return jsonify({"created": created, "failed": failed, "errors": errors}), 201 if not failed else 207
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# BULK EDIT
+# Bulk delete and edit select rows by an explicit id list or by a filter and
+# run as one DELETE/UPDATE statement each. The statement-level rollup and
+# data_versions triggers adjust each touched trip once inside it.
+EXPENSE_FILTER_KEYS = ("trip_id", "category", "person", "from", "to")
+EXPENSE_EDIT_FIELDS = ("category", "person", "description", "amount", "date", "time")
+
+def select_expenses(query, data):
+    if not hasattr(data, "get"):
+        raise ValueError("Expected a JSON object")
+    ids = data.get("ids")
+    filters = data.get("filter")
+    if (ids is None) == (filters is None):
+        raise ValueError("Pass either ids or filter")
+    if ids is not None:
+        if not isinstance(ids, list) or not ids:
+            raise ValueError("ids must be a non-empty list")
+        if len(ids) > EXPENSE_BULK_MAX_BATCH_SIZE:
+            raise ValueError(f"At most {EXPENSE_BULK_MAX_BATCH_SIZE} ids per request")
+        return query.in_("id", [str(i) for i in ids])
+    if not isinstance(filters, dict):
+        raise ValueError("filter must be a JSON object")
+    unknown = set(filters) - set(EXPENSE_FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter field(s): {', '.join(sorted(unknown))}")
+    filters = {k: v for k, v in filters.items() if v not in (None, "")}
+    if not filters:
+        # An empty filter would match every expense.
+        raise ValueError("filter must name at least one field")
+    for key in ("from", "to"):
+        if key in filters:
+            try:
+                datetime.strptime(filters[key], "%Y-%m-%d")
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be YYYY-MM-DD")
+    for key in ("trip_id", "category", "person"):
+        if key in filters:
+            query = query.eq(key, filters[key])
+    if "from" in filters:
+        query = query.gte("date", filters["from"])
+    if "to" in filters:
+        query = query.lte("date", filters["to"])
+    return query
+
+def expense_changes(data):
+    if not hasattr(data, "get"):
+        raise ValueError("Expected a JSON object")
+    changes = data.get("set")
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError("set must be a non-empty JSON object")
+    unknown = set(changes) - set(EXPENSE_EDIT_FIELDS)
+    if unknown:
+        raise ValueError(f"Cannot edit field(s): {', '.join(sorted(unknown))}")
+    changes = dict(changes)
+    if "amount" in changes:
+        try:
+            changes["amount"] = float(changes["amount"])
+        except (TypeError, ValueError):
+            raise ValueError("amount must be a number")
+    try:
+        if "date" in changes:
+            datetime.strptime(changes["date"], "%Y-%m-%d")
+        if "time" in changes:
+            datetime.strptime(changes["time"], "%H:%M:%S")
+    except (TypeError, ValueError):
+        raise ValueError("date must be YYYY-MM-DD and time HH:MM:SS")
+    return changes
+
+def bump_expense_rows(rows):
+    if rows:
+        bump_versions(TRIPS_SCOPE, EXPENSES_SCOPE, *{trip_scope(e["trip_id"]) for e in rows})
+
+@app.route("/api/expenses/bulk-delete", methods=["POST"])
+def delete_expenses_bulk():
+    try:
+        db = get_db()
+        deleted = select_expenses(db.table("expenses").delete(), request.get_json()).execute().data
+        bump_expense_rows(deleted)
+        receipts = purge_orphaned_receipts(db, {e.get("image") for e in deleted})
+        return jsonify({"deleted": len(deleted), "receipts_removed": receipts})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/expenses", methods=["PATCH"])
+def update_expenses():
+    try:
+        data = request.get_json()
+        db = get_db()
+        query = select_expenses(db.table("expenses").update(expense_changes(data)), data)
+        updated = query.execute().data
+        bump_expense_rows(updated)
+        return jsonify({"updated": len(updated)})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1424,184 +2740,532 @@ def add_expense():
 def delete_expense(expense_id):
     try:
         db = get_db()
-        db.table("expenses").delete().eq("id", expense_id).execute()
-        return jsonify({"message": "Expense deleted"})
+        deleted = db.table("expenses").delete().eq("id", expense_id).execute().data
+        bump_versions(TRIPS_SCOPE, EXPENSES_SCOPE, *(trip_scope(e["trip_id"]) for e in deleted))
+        receipts = purge_orphaned_receipts(db, {e.get("image") for e in deleted})
+        return jsonify({"message": "Expense deleted", "receipts_removed": receipts})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# RECEIPTS
+@app.route("/api/receipts/<digest>", methods=["GET"])
+def get_receipt(digest):
+    if not RECEIPT_HASH_RE.match(digest):
+        return jsonify({"error": "Receipt not found"}), 404
+    if request.if_none_match.contains(digest):
+        response = Response(status=304)
+    else:
+        data = get_receipt_store().get(digest)
+        if data is None:
+            return jsonify({"error": "Receipt not found"}), 404
+        response = Response(data, mimetype=sniff_image_type(data))
+    response.set_etag(digest)
+    response.headers["Cache-Control"] = RECEIPT_CACHE_CONTROL
+    return response
+
+@app.route("/api/receipts/<digest>/thumbnail", methods=["GET"])
+def get_receipt_thumbnail(digest):
+    if not RECEIPT_HASH_RE.match(digest):
+        return jsonify({"error": "Receipt not found"}), 404
+    etag = f"{digest}-thumb"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        store = get_receipt_store()
+        data = store.get_thumbnail(digest)
+        if data is None:
+            original = store.get(digest)
+            if original is None:
+                return jsonify({"error": "Receipt not found"}), 404
+            data = save_thumbnail(digest, BytesIO(original))
+            if data is None:
+                return jsonify({"error": "Receipt cannot be thumbnailed"}), 415
+        response = Response(data, mimetype="image/jpeg")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = RECEIPT_CACHE_CONTROL
+    return response
+
 # SUMMARY
+class TripNotFound(Exception):
+    pass
+
+ROLLUP_COLUMNS = "trip_id,total,expense_count,categories,persons"
+MISSING_RELATION_CODES = ("42P01", "PGRST205")
+_summary_rpc_available = True
+_rollups_available = True
+
+def summarize_expenses(rows):
+    total_spent = 0.0
+    count = 0
+    categories = {}
+    persons = {}
+    for e in rows:
+        amount = float(e["amount"])
+        total_spent += amount
+        count += 1
+        categories[e["category"]] = categories.get(e["category"], 0) + amount
+        person = persons.setdefault(e.get("person") or "", {"total": 0.0, "count": 0})
+        person["total"] += amount
+        person["count"] += 1
+    return {"total_spent": total_spent, "expense_count": count, "categories": categories, "persons": persons}
+
+def rollup_totals(rollup):
+    return {
+        "total_spent": float(rollup["total"]),
+        "expense_count": int(rollup["expense_count"]),
+        "categories": {k: float(v["total"]) for k, v in rollup["categories"].items()},
+        "persons": {k: {"total": float(v["total"]), "count": int(v["count"])} for k, v in rollup["persons"].items()}
+    }
+
+def fetch_rollups(db, trip_id=None):
+    global _rollups_available
+    if not _rollups_available:
+        return None
+    try:
+        query = db.table("trip_rollups").select(ROLLUP_COLUMNS)
+        if trip_id is not None:
+            query = query.eq("trip_id", trip_id)
+        return query.execute().data
+    except APIError as e:
+        # The trip_rollups migration has not been applied.
+        if e.code in MISSING_RELATION_CODES:
+            _rollups_available = False
+        return None
+
+def compute_trip_totals(db, trip_id):
+    global _summary_rpc_available
+    if _summary_rpc_available:
+        try:
+            totals = db.rpc("trip_summary", {"p_trip_id": trip_id}).execute().data
+            return {
+                "total_spent": float(totals["total_spent"]),
+                "expense_count": int(totals["expense_count"]),
+                "categories": {k: float(v) for k, v in totals["categories"].items()},
+                "persons": {k: {"total": float(v["total"]), "count": int(v["count"])}
+                            for k, v in totals.get("persons", {}).items()}
+            }
+        except APIError as e:
+            # PGRST202: the trip_summary function has not been deployed.
+            if e.code == "PGRST202":
+                _summary_rpc_available = False
+    pages = iter_expense_pages(db, ",".join(EXPENSE_SUMMARY_FIELDS), trip_id)
+    return summarize_expenses(e for rows in pages for e in rows)
+
+def fetch_trip_totals(db, trip_id):
+    rollups = fetch_rollups(db, trip_id)
+    if rollups:
+        return rollup_totals(rollups[0])
+    return compute_trip_totals(db, trip_id)
+
+def summary_response(trip, totals):
+    total_spent = totals["total_spent"]
+    remaining = (float(trip["budget"]) - total_spent) if trip["budget"] is not None else None
+    return {
+        "trip": trip,
+        "total_budget": float(trip["budget"]) if trip["budget"] is not None else None,
+        "total_spent": total_spent,
+        "remaining": remaining,
+        "expense_count": totals["expense_count"],
+        "categories": totals["categories"],
+        "persons": totals["persons"]
+    }
+
 @app.route("/api/trips/<trip_id>/summary", methods=["GET"])
 def get_trip_summary(trip_id):
     try:
-        db = get_db()
-        trip_result = db.table("trips").select("*").eq("id", trip_id).execute()
-        if not trip_result.data:
-            return jsonify({"error": "Trip not found"}), 404
-        trip = trip_result.data[0]
-        expenses_result = db.table("expenses").select("*").eq("trip_id", trip_id).execute()
-        trip_expenses = expenses_result.data
-        total_spent = sum(float(e["amount"]) for e in trip_expenses)
-        remaining = (float(trip["budget"]) - total_spent) if trip["budget"] is not None else None
-        categories = {}
-        for e in trip_expenses:
-            cat = e["category"]
-            categories[cat] = categories.get(cat, 0) + float(e["amount"])
-        return jsonify({
-            "trip": trip,
-            "total_budget": float(trip["budget"]) if trip["budget"] is not None else None,
-            "total_spent": total_spent,
-            "remaining": remaining,
-            "expense_count": len(trip_expenses),
-            "categories": categories
-        })
+        def build():
+            db = get_db()
+            trip_result = db.table("trips").select(",".join(TRIP_COLUMNS)).eq("id", trip_id).execute()
+            if not trip_result.data:
+                raise TripNotFound("Trip not found")
+            return summary_response(trip_result.data[0], fetch_trip_totals(db, trip_id))
+        return cached_json(trip_scope(trip_id), build)
+    except TripNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# DASHBOARD
+DASHBOARD_PAGE_SIZE = 100
+
+def fetch_dashboard(db, trip_id, limit):
+    # One PostgREST call: the trip with its rollup and first page of expenses
+    # embedded. Needs the trip_rollups migration for the relationship.
+    expense_columns = ",".join(EXPENSE_LIST_FIELDS + tuple(c for c in CURSOR_COLUMNS if c not in EXPENSE_LIST_FIELDS))
+    result = (db.table("trips")
+              .select(f"{','.join(TRIP_COLUMNS)},trip_rollups({ROLLUP_COLUMNS}),expenses({expense_columns})")
+              .eq("id", trip_id)
+              .order("created_at", foreign_table="expenses")
+              .order("id", foreign_table="expenses")
+              .limit(limit, foreign_table="expenses")
+              .execute())
+    if not result.data:
+        return None
+    trip = result.data[0]
+    rollup = trip.pop("trip_rollups")
+    if isinstance(rollup, list):
+        rollup = rollup[0] if rollup else None
+    expenses = trip.pop("expenses")
+    next_cursor = encode_cursor(expenses[-1]) if len(expenses) == limit else None
+    for e in expenses:
+        for c in CURSOR_COLUMNS:
+            if c not in EXPENSE_LIST_FIELDS:
+                del e[c]
+    totals = rollup_totals(rollup) if rollup else compute_trip_totals(db, trip_id)
+    return trip, totals, expenses, next_cursor
+
+@app.route("/api/trips/<trip_id>/dashboard", methods=["GET"])
+def get_trip_dashboard(trip_id):
+    try:
+        limit = page_limit(DASHBOARD_PAGE_SIZE)
+        def build():
+            db = get_db()
+            try:
+                dashboard = fetch_dashboard(db, trip_id, limit)
+            except APIError:
+                dashboard = None
+                trip_result = db.table("trips").select(",".join(TRIP_COLUMNS)).eq("id", trip_id).execute()
+                if trip_result.data:
+                    expenses, next_cursor = fetch_expense_page(db, ",".join(EXPENSE_LIST_FIELDS), trip_id, limit=limit)
+                    dashboard = trip_result.data[0], fetch_trip_totals(db, trip_id), expenses, next_cursor
+            if dashboard is None:
+                raise TripNotFound("Trip not found")
+            trip, totals, expenses, next_cursor = dashboard
+            return dict(summary_response(trip, totals), expenses=expenses, next_cursor=next_cursor)
+        return cached_json(trip_scope(trip_id), build)
+    except TripNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# EXPORT CACHE
+EXPORT_CACHE_DIR = os.environ.get("EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "exports"))
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+EXPORT_CACHE_DISK_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+class ExportCache:
+    # Rendered exports, at most one per trip and format, each stored with the
+    # tag it was rendered under. A write bumps the trip's version, changing the
+    # tag, so the old artifact is simply never served again. Entries pushed
+    # out of memory spill to root and are promoted back on the next hit.
+
+    def __init__(self, root, max_bytes, disk_max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "spills": 0}
+
+    def _path(self, key):
+        trip_id, fmt = key
+        return os.path.join(self.root, f"{trip_id}.{fmt}")
+
+    def get(self, trip_id, fmt, tag):
+        key = (str(trip_id), fmt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == tag:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1], entry[2]
+            if entry is not None:
+                self._remove(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                header = json.loads(f.readline())
+                body = f.read() if header.get("tag") == tag else None
+        except (OSError, ValueError):
+            body = None
+        if body is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["disk_hits"] += 1
+        self._remember(key, tag, header["filename"], body)
+        return header["filename"], body
+
+    def put(self, trip_id, fmt, tag, filename, body):
+        self._remember((str(trip_id), fmt), tag, filename, body)
+
+    def _remember(self, key, tag, filename, body):
+        if len(body) > self.max_bytes:
+            self._spill(key, tag, filename, body)
+            return
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (tag, filename, body)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                old_key = next(iter(self._entries))
+                evicted.append((old_key, self._entries[old_key]))
+                self._remove(old_key)
+        for old_key, entry in evicted:
+            self._spill(old_key, *entry)
+
+    def _remove(self, key):
+        _, _, body = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def _spill(self, key, tag, filename, body):
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.root, prefix=".tmp-", delete=False) as tmp:
+                tmp.write(json.dumps({"tag": tag, "filename": filename}).encode() + b"\n")
+                tmp.write(body)
+            os.replace(tmp.name, self._path(key))
+            self.stats["spills"] += 1
+            self._trim_disk()
+        except OSError as e:
+            app.logger.warning("Could not spill export %s: %s", key, e)
+
+    def _trim_disk(self):
+        files = sorted((f for f in os.scandir(self.root) if f.is_file() and not f.name.startswith(".tmp-")),
+                       key=lambda f: f.stat().st_mtime)
+        total = sum(f.stat().st_size for f in files)
+        for f in files:
+            if total <= self.disk_max_bytes:
+                break
+            total -= f.stat().st_size
+            os.remove(f.path)
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes,
+                        max_bytes=self.max_bytes, disk_max_bytes=self.disk_max_bytes)
+
+_export_cache = None
+_export_cache_lock = threading.Lock()
+
+def get_export_cache():
+    global _export_cache
+    with _export_cache_lock:
+        if _export_cache is None:
+            _export_cache = ExportCache(EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES, EXPORT_CACHE_DISK_MAX_BYTES)
+        return _export_cache
+
+EXPORT_MIMETYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+    "csv": "text/csv",
+}
+
+def export_tag(trip_id, fmt, scopes=None):
+    token = version_token(*(scopes or [trip_scope(trip_id)]))
+    if token is None:
+        return None
+    return hashlib.sha1(f"{token}:{trip_id}:{fmt}".encode()).hexdigest()[:20]
+
+def export_file(fmt, tag, artifact):
+    if tag and request.if_none_match.contains(tag):
+        response = Response(status=304)
+    else:
+        filename, body = artifact
+        response = send_file(BytesIO(body), mimetype=EXPORT_MIMETYPES[fmt], as_attachment=True, download_name=filename)
+    if tag:
+        response.set_etag(tag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def export_response(trip_id, fmt, render, scopes=None):
+    # render(trip_id) returns (filename, body), or None when there is nothing
+    # to export. The tag is taken before rendering so a write that lands
+    # mid-render leaves the artifact stale rather than mislabelled.
+    tag = export_tag(trip_id, fmt, scopes)
+    if tag is None:
+        # No shared version to key the cache on.
+        artifact = render(trip_id)
+        if artifact is None:
+            return jsonify({"error": "No expenses to export"}), 400
+        return export_file(fmt, None, artifact)
+    if request.if_none_match.contains(tag):
+        return export_file(fmt, tag, None)
+    cache = get_export_cache()
+    artifact = cache.get(trip_id, fmt, tag)
+    if artifact is None:
+        artifact = render(trip_id)
+        if artifact is None:
+            return jsonify({"error": "No expenses to export"}), 400
+        cache.put(trip_id, fmt, tag, *artifact)
+    return export_file(fmt, tag, artifact)
+
+def track_progress(pages, progress, total):
+    done = 0
+    for rows in pages:
+        yield rows
+        done += len(rows)
+        if progress:
+            progress(done, total)
+
 # EXCEL EXPORT
+import itertools
+
+EXCEL_HEADERS = ("Date", "Time", "Category", "Amount", "Person", "Description")
+EXCEL_WIDTHS = (12, 10, 20, 15, 18, 40)
+
+def add_excel_styles(wb):
+    # Registered once per workbook as named styles, so styling a cell is a
+    # lookup by name rather than re-hashing Font/Border objects per cell.
+    from openpyxl.styles import NamedStyle, Font, PatternFill, Alignment, Border, Side, DEFAULT_FONT
+    thin = Side(style="thin", color="e2e8f0")
+    medium = Side(style="medium", color="1e293b")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    totals_border = Border(left=medium, right=medium, top=medium, bottom=medium)
+    right = Alignment(horizontal="right")
+    def fill(color):
+        return PatternFill(start_color=color, end_color=color, fill_type="solid")
+    styles = {
+        "title": NamedStyle("title", font=Font(size=16, bold=True, color="FFFFFF"), fill=fill("667eea"),
+                            alignment=Alignment(horizontal="left", vertical="center")),
+        "budget": NamedStyle("budget", font=Font(size=11, bold=True)),
+        "header": NamedStyle("header", font=Font(bold=True, color="FFFFFF", size=11), fill=fill("1e293b"),
+                             alignment=Alignment(horizontal="center", vertical="center"), border=border),
+        "cell": NamedStyle("cell", font=DEFAULT_FONT, border=border),
+        "amount": NamedStyle("amount", border=border, number_format="#,##0.00", font=Font(bold=True),
+                             alignment=Alignment(horizontal="right", vertical="center")),
+        "total_label": NamedStyle("total_label", font=Font(bold=True, size=11), fill=fill("f8fafc"),
+                                  border=totals_border, alignment=right),
+        "total": NamedStyle("total", font=Font(bold=True, size=12), number_format="#,##0.00", fill=fill("f8fafc"),
+                            border=totals_border, alignment=right),
+        "budget_total": NamedStyle("budget_total", font=DEFAULT_FONT, number_format="#,##0.00", fill=fill("f8fafc"),
+                                   border=totals_border, alignment=right),
+        "footer": NamedStyle("footer", font=Font(size=9, italic=True, color="64748b")),
+    }
+    for state, color in (("under", "10b981"), ("over", "ef4444")):
+        styles[f"remaining_label_{state}"] = NamedStyle(f"remaining_label_{state}", font=Font(bold=True, size=12, color="FFFFFF"),
+                                                        fill=fill(color), border=totals_border, alignment=right)
+        styles[f"remaining_{state}"] = NamedStyle(f"remaining_{state}", font=Font(bold=True, size=13, color="FFFFFF"),
+                                                  number_format="#,##0.00", fill=fill(color), border=totals_border, alignment=right)
+    for style in styles.values():
+        wb.add_named_style(style)
+
+def excel_cell(ws, value, style):
+    from openpyxl.cell import WriteOnlyCell
+    cell = WriteOnlyCell(ws, value)
+    cell.style = style
+    return cell
+
+def start_trip_sheet(wb, trip, title="Expenses"):
+    ws = wb.create_sheet(title)
+    for col, width in zip("ABCDEF", EXCEL_WIDTHS):
+        ws.column_dimensions[col].width = width
+    ws.row_dimensions[1].height = 30
+    ws.row_dimensions[5].height = 25
+    ws.merged_cells.add("A1:F1")
+    ws.append([excel_cell(ws, f"TRIP: {trip['name']}", "title")])
+    ws.append([excel_cell(ws, f"Budget: Rs.{float(trip['budget']):,.2f}" if trip["budget"] else "Budget: Not Set", "budget")])
+    ws.append([])
+    ws.append([])
+    ws.append([excel_cell(ws, h, "header") for h in EXCEL_HEADERS])
+    return ws
+
+def append_expense_rows(ws, rows):
+    for e in rows:
+        ws.append([excel_cell(ws, e["date"], "cell"), excel_cell(ws, e["time"], "cell"),
+                   excel_cell(ws, e["category"], "cell"), excel_cell(ws, e["amount"], "amount"),
+                   excel_cell(ws, e["person"], "cell"), excel_cell(ws, e["description"], "cell")])
+
+def finish_trip_sheet(ws, trip, row_count, total_spent):
+    last_row = row_count + 7
+    ws.row_dimensions[last_row].height = 25
+    tail = {last_row: [None, None, None, excel_cell(ws, "TOTAL SPENT:", "total_label"),
+                       excel_cell(ws, total_spent, "total")]}
+    if trip["budget"] is not None:
+        remaining = float(trip["budget"]) - total_spent
+        state = "under" if remaining >= 0 else "over"
+        ws.row_dimensions[last_row + 1].height = 25
+        ws.row_dimensions[last_row + 2].height = 30
+        tail[last_row + 1] = [None, None, None, excel_cell(ws, "TRIP BUDGET:", "total_label"),
+                              excel_cell(ws, float(trip["budget"]), "budget_total")]
+        tail[last_row + 2] = [None, None, None, excel_cell(ws, "REMAINING:", f"remaining_label_{state}"),
+                              excel_cell(ws, remaining, f"remaining_{state}")]
+    footer_row = last_row + 4 if trip["budget"] else last_row + 2
+    footer = tail.setdefault(footer_row, [None])
+    footer[0] = excel_cell(ws, f"Generated: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}", "footer")
+    for row in range(row_count + 6, max(tail) + 1):
+        ws.append(tail.get(row, []))
+
+def write_trip_sheet(wb, trip, pages, total_spent, title="Expenses"):
+    # Rows are appended as they arrive from pages, so only the current page
+    # is ever held in memory. Layout matches the original pandas export.
+    ws = start_trip_sheet(wb, trip, title)
+    row_count = 0
+    for rows in pages:
+        append_expense_rows(ws, rows)
+        row_count += len(rows)
+    finish_trip_sheet(ws, trip, row_count, total_spent)
+    return row_count
+
+def render_excel(trip, pages, total_spent):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    add_excel_styles(wb)
+    write_trip_sheet(wb, trip, pages, total_spent)
+    output = BytesIO()
+    wb.save(output)
+    output.seek(0)
+    return output
+
+def build_excel_export(trip_id, progress=None):
+    db = get_db()
+    trip = db.table("trips").select("name,budget").eq("id", trip_id).execute().data[0]
+    pages = iter_expense_pages(db, ",".join(EXPENSE_EXPORT_FIELDS), trip_id=trip_id, page_size=EXPENSE_MAX_PAGE_SIZE)
+    first = next(pages, None)
+    if not first:
+        return None
+    totals = fetch_trip_totals(db, trip_id)
+    pages = track_progress(itertools.chain([first], pages), progress, totals["expense_count"])
+    output = render_excel(trip, pages, totals["total_spent"])
+    filename = f"{trip['name'].replace(' ','_')}_{datetime.now().strftime('%Y%m%d')}.xlsx"
+    return filename, output.getvalue()
+
 @app.route("/api/export/<trip_id>", methods=["GET"])
 def export_excel(trip_id):
     try:
-        import pandas as pd
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        db = get_db()
-        trip = db.table("trips").select("*").eq("id", trip_id).execute().data[0]
-        trip_expenses = db.table("expenses").select("*").eq("trip_id", trip_id).execute().data
-        if not trip_expenses:
-            return jsonify({"error": "No expenses to export"}), 400
-        df = pd.DataFrame(trip_expenses)[["date","time","category","amount","person","description"]]
-        df.columns = ["Date","Time","Category","Amount","Person","Description"]
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False, sheet_name="Expenses", startrow=4)
-            ws = writer.sheets["Expenses"]
-            ws["A1"] = f"TRIP: {trip['name']}"
-            ws["A1"].font = Font(size=16, bold=True, color="FFFFFF")
-            ws["A1"].fill = PatternFill(start_color="667eea", end_color="667eea", fill_type="solid")
-            ws["A1"].alignment = Alignment(horizontal="left", vertical="center")
-            ws.merge_cells("A1:F1")
-            ws.row_dimensions[1].height = 30
-            ws["A2"] = f"Budget: Rs.{float(trip['budget']):,.2f}" if trip["budget"] else "Budget: Not Set"
-            ws["A2"].font = Font(size=11, bold=True)
-            hf = PatternFill(start_color="1e293b", end_color="1e293b", fill_type="solid")
-            border = Border(left=Side(style="thin",color="e2e8f0"),right=Side(style="thin",color="e2e8f0"),
-                           top=Side(style="thin",color="e2e8f0"),bottom=Side(style="thin",color="e2e8f0"))
-            for col in range(1, 7):
-                cell = ws.cell(row=5, column=col)
-                cell.fill = hf
-                cell.font = Font(bold=True, color="FFFFFF", size=11)
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-                cell.border = border
-            ws.row_dimensions[5].height = 25
-            for row in range(6, len(df) + 6):
-                for col in range(1, 7):
-                    cell = ws.cell(row=row, column=col)
-                    cell.border = border
-                    if col == 4:
-                        cell.number_format = "#,##0.00"
-                        cell.alignment = Alignment(horizontal="right", vertical="center")
-                        cell.font = Font(bold=True)
-            for col, width in zip("ABCDEF", [12,10,20,15,18,40]):
-                ws.column_dimensions[col].width = width
-            last_row = len(df) + 7
-            sf = PatternFill(start_color="f8fafc", end_color="f8fafc", fill_type="solid")
-            tb = Border(left=Side(style="medium",color="1e293b"),right=Side(style="medium",color="1e293b"),
-                       top=Side(style="medium",color="1e293b"),bottom=Side(style="medium",color="1e293b"))
-            ws[f"D{last_row}"] = "TOTAL SPENT:"
-            ws[f"D{last_row}"].font = Font(bold=True, size=11)
-            ws[f"D{last_row}"].fill = sf
-            ws[f"D{last_row}"].border = tb
-            ws[f"D{last_row}"].alignment = Alignment(horizontal="right")
-            ws[f"E{last_row}"] = sum(float(e["amount"]) for e in trip_expenses)
-            ws[f"E{last_row}"].font = Font(bold=True, size=12)
-            ws[f"E{last_row}"].number_format = "#,##0.00"
-            ws[f"E{last_row}"].fill = sf
-            ws[f"E{last_row}"].border = tb
-            ws[f"E{last_row}"].alignment = Alignment(horizontal="right")
-            ws.row_dimensions[last_row].height = 25
-            if trip["budget"] is not None:
-                remaining = float(trip["budget"]) - sum(float(e["amount"]) for e in trip_expenses)
-                rc = "10b981" if remaining >= 0 else "ef4444"
-                ws[f"D{last_row+1}"] = "TRIP BUDGET:"
-                ws[f"D{last_row+1}"].font = Font(bold=True, size=11)
-                ws[f"D{last_row+1}"].fill = sf
-                ws[f"D{last_row+1}"].border = tb
-                ws[f"D{last_row+1}"].alignment = Alignment(horizontal="right")
-                ws[f"E{last_row+1}"] = float(trip["budget"])
-                ws[f"E{last_row+1}"].number_format = "#,##0.00"
-                ws[f"E{last_row+1}"].fill = sf
-                ws[f"E{last_row+1}"].border = tb
-                ws[f"E{last_row+1}"].alignment = Alignment(horizontal="right")
-                ws[f"D{last_row+2}"] = "REMAINING:"
-                ws[f"D{last_row+2}"].font = Font(bold=True, size=12, color="FFFFFF")
-                ws[f"D{last_row+2}"].fill = PatternFill(start_color=rc, end_color=rc, fill_type="solid")
-                ws[f"D{last_row+2}"].border = tb
-                ws[f"D{last_row+2}"].alignment = Alignment(horizontal="right")
-                ws[f"E{last_row+2}"] = remaining
-                ws[f"E{last_row+2}"].font = Font(bold=True, size=13, color="FFFFFF")
-                ws[f"E{last_row+2}"].number_format = "#,##0.00"
-                ws[f"E{last_row+2}"].fill = PatternFill(start_color=rc, end_color=rc, fill_type="solid")
-                ws[f"E{last_row+2}"].border = tb
-                ws[f"E{last_row+2}"].alignment = Alignment(horizontal="right")
-                ws.row_dimensions[last_row+1].height = 25
-                ws.row_dimensions[last_row+2].height = 30
-            footer_row = last_row + 4 if trip["budget"] else last_row + 2
-            ws[f"A{footer_row}"] = f"Generated: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}"
-            ws[f"A{footer_row}"].font = Font(size=9, italic=True, color="64748b")
-        output.seek(0)
-        filename = f"{trip['name'].replace(' ','_')}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-        return send_file(output, mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        as_attachment=True, download_name=filename)
+        return export_response(trip_id, "xlsx", build_excel_export)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # PDF EXPORT
-@app.route("/api/export-pdf/<trip_id>", methods=["GET"])
-def export_pdf(trip_id):
-    try:
-        from reportlab.lib import colors
-        from reportlab.lib.pagesizes import letter
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import inch
-        from reportlab.lib.enums import TA_CENTER
-        db = get_db()
-        trip = db.table("trips").select("*").eq("id", trip_id).execute().data[0]
-        trip_expenses = db.table("expenses").select("*").eq("trip_id", trip_id).execute().data
-        if not trip_expenses:
-            return jsonify({"error": "No expenses to export"}), 400
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30)
-        elements = []
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle("T", parent=styles["Heading1"], fontSize=24,
-            textColor=colors.HexColor("#667eea"), spaceAfter=30, alignment=TA_CENTER, fontName="Helvetica-Bold")
-        elements.append(Paragraph(f"Trip: {trip['name']}", title_style))
-        elements.append(Spacer(1, 12))
-        total_spent = sum(float(e["amount"]) for e in trip_expenses)
-        budget_data = []
-        if trip["budget"]:
-            budget_data.append(["Trip Budget:", f"Rs.{float(trip['budget']):,.2f}"])
-        budget_data.append(["Total Spent:", f"Rs.{total_spent:,.2f}"])
-        if trip["budget"]:
-            budget_data.append(["Remaining:", f"Rs.{float(trip['budget']) - total_spent:,.2f}"])
-        bt = Table(budget_data, colWidths=[2*inch, 2*inch])
-        bt.setStyle(TableStyle([
+PDF_TABLE_CHUNK_ROWS = int(os.environ.get("PDF_TABLE_CHUNK_ROWS", "50"))
+PDF_HEADERS = ["Date", "Category", "Amount", "Person", "Description"]
+PDF_COL_WIDTHS = [72, 86.4, 72, 72, 165.6]
+
+def pdf_styles():
+    # Built once per document; every chunk of the expense table shares the
+    # same TableStyle instance.
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+    styles = getSampleStyleSheet()
+    return {
+        "title": ParagraphStyle("T", parent=styles["Heading1"], fontSize=24,
+            textColor=colors.HexColor("#667eea"), spaceAfter=30, alignment=TA_CENTER, fontName="Helvetica-Bold"),
+        "section": ParagraphStyle("S", parent=styles["Heading2"], fontSize=14,
+            textColor=colors.HexColor("#1e293b"), spaceBefore=6, spaceAfter=8, fontName="Helvetica-Bold"),
+        "subtotal": TableStyle([
+            ("BACKGROUND", (0,0), (-1,-1), colors.HexColor("#f8fafc")),
+            ("FONTNAME", (0,0), (-1,-1), "Helvetica-Bold"),
+            ("FONTSIZE", (0,0), (-1,-1), 9),
+            ("TOPPADDING", (0,0), (-1,-1), 8),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 8),
+            ("LINEABOVE", (0,0), (-1,0), 1, colors.HexColor("#1e293b")),
+            ("GRID", (0,0), (-1,-1), 0.5, colors.HexColor("#e2e8f0"))
+        ]),
+        "totals": TableStyle([
             ("BACKGROUND", (0,0), (-1,-1), colors.HexColor("#f8fafc")),
             ("FONTNAME", (0,0), (-1,-1), "Helvetica-Bold"),
             ("FONTSIZE", (0,0), (-1,-1), 12),
             ("BOTTOMPADDING", (0,0), (-1,-1), 12),
             ("TOPPADDING", (0,0), (-1,-1), 12),
             ("GRID", (0,0), (-1,-1), 1, colors.HexColor("#e2e8f0"))
-        ]))
-        elements.append(bt)
-        elements.append(Spacer(1, 30))
-        data = [["Date","Category","Amount","Person","Description"]]
-        for e in trip_expenses:
-            desc = e.get("description") or "-"
-            data.append([e["date"], e["category"], f"Rs.{float(e['amount']):,.2f}",
-                        e.get("person") or "-", desc[:50] + "..." if len(desc) > 50 else desc])
-        table = Table(data, colWidths=[1*inch, 1.2*inch, 1*inch, 1*inch, 2.3*inch])
-        table.setStyle(TableStyle([
+        ]),
+        "table": TableStyle([
             ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#1e293b")),
             ("TEXTCOLOR", (0,0), (-1,0), colors.whitesmoke),
             ("ALIGN", (0,0), (-1,0), "CENTER"),
@@ -1615,15 +3279,739 @@ def export_pdf(trip_id):
             ("BOTTOMPADDING", (0,1), (-1,-1), 8),
             ("GRID", (0,0), (-1,-1), 0.5, colors.HexColor("#e2e8f0")),
             ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.white, colors.HexColor("#f8fafc")])
-        ]))
-        elements.append(table)
-        doc.build(elements)
+        ]),
+    }
+
+def pdf_row(e):
+    desc = e["description"] or "-"
+    return [e["date"], e["category"], f"Rs.{float(e['amount']):,.2f}", e["person"] or "-",
+            desc if len(desc) <= 50 else desc[:50] + "..."]
+
+def pdf_table(rows, styles):
+    # Page-sized chunks keep reportlab's split work per table small; repeatRows
+    # carries the header over if a chunk still breaks across pages.
+    from reportlab.platypus import Table
+    table = Table([PDF_HEADERS] + rows, colWidths=PDF_COL_WIDTHS, repeatRows=1)
+    table.setStyle(styles["table"])
+    return table
+
+def trip_pdf_elements(trip, pages, total_spent, styles):
+    # Expenses are grouped into one section per category, largest subtotal
+    # first. Rows become table chunks as soon as a chunk fills, so only the
+    # flowables (not the fetched rows) are held until the document is built.
+    from reportlab.platypus import Table, Paragraph, Spacer
+    from reportlab.lib.units import inch
+    from xml.sax.saxutils import escape
+    # Paragraph text is parsed as markup; names and categories are free text.
+    elements = [Paragraph(escape(f"Trip: {trip['name']}"), styles["title"]), Spacer(1, 12)]
+    budget_data = []
+    if trip["budget"]:
+        budget_data.append(["Trip Budget:", f"Rs.{float(trip['budget']):,.2f}"])
+    budget_data.append(["Total Spent:", f"Rs.{total_spent:,.2f}"])
+    if trip["budget"]:
+        budget_data.append(["Remaining:", f"Rs.{float(trip['budget']) - total_spent:,.2f}"])
+    bt = Table(budget_data, colWidths=[2*inch, 2*inch])
+    bt.setStyle(styles["totals"])
+    elements.append(bt)
+    elements.append(Spacer(1, 30))
+    sections = {}
+    for rows in pages:
+        for e in rows:
+            section = sections.get(e["category"])
+            if section is None:
+                section = sections[e["category"]] = {"tables": [], "rows": [], "total": 0.0, "count": 0}
+            section["rows"].append(pdf_row(e))
+            section["total"] += float(e["amount"])
+            section["count"] += 1
+            if len(section["rows"]) == PDF_TABLE_CHUNK_ROWS:
+                section["tables"].append(pdf_table(section["rows"], styles))
+                section["rows"] = []
+    for category, section in sorted(sections.items(), key=lambda item: -item[1]["total"]):
+        if section["rows"]:
+            section["tables"].append(pdf_table(section["rows"], styles))
+        elements.append(Paragraph(escape(category or "Uncategorized"), styles["section"]))
+        elements.extend(section["tables"])
+        subtotal = Table([["", "Subtotal", f"Rs.{section['total']:,.2f}", f"{section['count']} expense(s)", ""]],
+                         colWidths=PDF_COL_WIDTHS)
+        subtotal.setStyle(styles["subtotal"])
+        elements.append(subtotal)
+        elements.append(Spacer(1, 18))
+    return elements
+
+def render_pdf(elements):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30)
+    doc.build(elements)
+    return buffer.getvalue()
+
+def build_pdf_export(trip_id, progress=None):
+    db = get_db()
+    trip = db.table("trips").select("name,budget").eq("id", trip_id).execute().data[0]
+    pages = iter_expense_pages(db, ",".join(EXPENSE_EXPORT_FIELDS), trip_id=trip_id, page_size=EXPENSE_MAX_PAGE_SIZE)
+    first = next(pages, None)
+    if not first:
+        return None
+    totals = fetch_trip_totals(db, trip_id)
+    pages = track_progress(itertools.chain([first], pages), progress, totals["expense_count"])
+    body = render_pdf(trip_pdf_elements(trip, pages, totals["total_spent"], pdf_styles()))
+    filename = f"{trip['name'].replace(' ','_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
+    return filename, body
+
+@app.route("/api/export-pdf/<trip_id>", methods=["GET"])
+def export_pdf(trip_id):
+    try:
+        return export_response(trip_id, "pdf", build_pdf_export)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# CSV EXPORT
+def build_csv_export(trip_id, progress=None):
+    db = get_db()
+    trip = db.table("trips").select("name").eq("id", trip_id).execute().data[0]
+    pages = iter_expense_pages(db, ",".join(EXPENSE_EXPORT_FIELDS), trip_id=trip_id, page_size=EXPENSE_MAX_PAGE_SIZE)
+    first = next(pages, None)
+    if not first:
+        return None
+    total = fetch_trip_totals(db, trip_id)["expense_count"] if progress else None
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(EXCEL_HEADERS)
+    for rows in track_progress(itertools.chain([first], pages), progress, total):
+        writer.writerows([e[f] for f in EXPENSE_EXPORT_FIELDS] for e in rows)
+    filename = f"{trip['name'].replace(' ','_')}_{datetime.now().strftime('%Y%m%d')}.csv"
+    return filename, output.getvalue().encode()
+
+# EXPORT JOBS
+from concurrent.futures import ThreadPoolExecutor
+
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "2"))
+EXPORT_JOB_TTL = int(os.environ.get("EXPORT_JOB_TTL", "3600"))
+EXPORT_BUILDERS = {"xlsx": build_excel_export, "pdf": build_pdf_export, "csv": build_csv_export}
+
+# Job records live in process memory; the finished file itself goes into the
+# export cache under the job's tag, so records stay small and a finished job
+# is served exactly like a cached synchronous export.
+# That makes jobs single-process only: on a serverless deploy the worker is
+# frozen once the response is sent and the status poll lands on another
+# instance. They are off there (Vercel sets VERCEL) unless EXPORT_JOBS=1;
+# the synchronous /api/export/<trip_id> endpoints work everywhere.
+EXPORT_JOBS_ENABLED = os.environ.get("EXPORT_JOBS", "0" if os.environ.get("VERCEL") else "1") == "1"
+_export_jobs = {}
+_export_jobs_inflight = {}
+_export_jobs_lock = threading.Lock()
+_export_pool = None
+
+def get_export_pool():
+    global _export_pool
+    with _export_jobs_lock:
+        if _export_pool is None:
+            _export_pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+        return _export_pool
+
+def job_view(job):
+    view = {k: job[k] for k in ("id", "trip_id", "format", "status", "processed", "total", "error")}
+    view["url"] = f"/api/exports/{job['id']}"
+    return view
+
+def submit_export_job(trip_id, fmt):
+    # Returns the in-flight job for the same trip, format and data version
+    # if there is one, so repeated clicks never render twice.
+    tag = export_tag(trip_id, fmt)
+    key = (str(trip_id), fmt, tag)
+    with _export_jobs_lock:
+        now = time.time()
+        for job_id in [j for j, job in _export_jobs.items() if job["finished_at"] and now - job["finished_at"] > EXPORT_JOB_TTL]:
+            del _export_jobs[job_id]
+        job_id = _export_jobs_inflight.get(key) if tag else None
+        if job_id:
+            return _export_jobs[job_id]
+        # Without a data version the artifact is keyed by the job alone.
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "trip_id": str(trip_id), "format": fmt, "tag": tag or job_id, "status": "queued",
+               "processed": 0, "total": None, "error": None, "code": None, "finished_at": None}
+        _export_jobs[job_id] = job
+        if tag:
+            _export_jobs_inflight[key] = job_id
+    get_export_pool().submit(run_export_job, job, key)
+    return job
+
+def run_export_job(job, key):
+    def progress(done, total):
+        job["processed"], job["total"] = done, total
+    job["status"] = "running"
+    try:
+        cache = get_export_cache()
+        if cache.get(job["trip_id"], job["format"], job["tag"]) is None:
+            artifact = EXPORT_BUILDERS[job["format"]](job["trip_id"], progress)
+            if artifact is None:
+                raise ValueError("No expenses to export")
+            cache.put(job["trip_id"], job["format"], job["tag"], *artifact)
+        job["status"] = "done"
+    except ValueError as e:
+        job["status"], job["error"], job["code"] = "failed", str(e), 400
+    except Exception as e:
+        app.logger.exception("Export job %s failed", job["id"])
+        job["status"], job["error"], job["code"] = "failed", str(e), 500
+    finally:
+        job["finished_at"] = time.time()
+        with _export_jobs_lock:
+            _export_jobs_inflight.pop(key, None)
+
+def export_jobs_unavailable():
+    return jsonify({"error": "Export jobs need a single long-running process; "
+                             "use the synchronous /api/export endpoints or set EXPORT_JOBS=1"}), 501
+
+@app.route("/api/exports", methods=["POST"])
+def create_export_job():
+    if not EXPORT_JOBS_ENABLED:
+        return export_jobs_unavailable()
+    try:
+        data = request.get_json(silent=True) or {}
+        fmt = data.get("format", "xlsx")
+        if fmt not in EXPORT_BUILDERS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_BUILDERS)}")
+        if not data.get("trip_id"):
+            raise ValueError("trip_id is required")
+        if not get_db().table("trips").select("id").eq("id", data["trip_id"]).execute().data:
+            return jsonify({"error": "Trip not found"}), 404
+        job = submit_export_job(data["trip_id"], fmt)
+        return jsonify(job_view(job)), 202, {"Location": f"/api/exports/{job['id']}"}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/exports/<job_id>", methods=["GET"])
+def get_export_job(job_id):
+    if not EXPORT_JOBS_ENABLED:
+        return export_jobs_unavailable()
+    try:
+        job = _export_jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Export job not found"}), 404
+        if job["status"] == "failed":
+            return jsonify(job_view(job)), job["code"]
+        if job["status"] != "done":
+            return jsonify(job_view(job)), 202
+        artifact = get_export_cache().get(job["trip_id"], job["format"], job["tag"])
+        if artifact is None:
+            return jsonify({"error": "Export is no longer available, request it again"}), 410
+        return export_file(job["format"], job["tag"], artifact)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# CONSOLIDATED EXPORT
+REPORT_MAX_TRIPS = int(os.environ.get("REPORT_MAX_TRIPS", "100"))
+REPORT_FIELDS = EXPENSE_EXPORT_FIELDS + ("trip_id",)
+REPORT_HEADERS = ("Trip", "Budget", "Expenses", "Total Spent", "Remaining")
+REPORT_WIDTHS = (30, 15, 12, 15, 15)
+
+def report_selection():
+    trip_ids = [t.strip() for t in request.args.get("trip_ids", "").split(",") if t.strip()]
+    if not all(t.isdigit() for t in trip_ids):
+        raise ValueError("trip_ids must be a comma-separated list of ids")
+    if len(trip_ids) > REPORT_MAX_TRIPS:
+        raise ValueError(f"At most {REPORT_MAX_TRIPS} trips per report")
+    date_range = (request.args.get("from") or None, request.args.get("to") or None)
+    try:
+        for d in date_range:
+            if d:
+                datetime.strptime(d, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError("from and to must be YYYY-MM-DD")
+    if not trip_ids and not any(date_range):
+        raise ValueError("Pass trip_ids, a from/to date range, or both")
+    return trip_ids, date_range
+
+def prefetch(iterator):
+    # Pulls the next item on a worker thread while the caller works on the
+    # current one, so page fetches overlap with rendering.
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(next, iterator, None)
+        while True:
+            item = future.result()
+            if item is None:
+                return
+            future = pool.submit(next, iterator, None)
+            yield item
+
+def open_report(trip_ids, date_range):
+    # Every selected trip's expenses come from one keyset-paged query; trip
+    # rows are fetched concurrently with the first page. Trashed trips are
+    # left out of trips, and callers skip their rows. pages is None when the
+    # selection has no expenses.
+    db = get_db()
+    pages = prefetch(iter_expense_pages(db, ",".join(REPORT_FIELDS), page_size=EXPENSE_MAX_PAGE_SIZE,
+                                        trip_ids=trip_ids, date_range=date_range))
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        trips = pool.submit(fetch_trip_list, db, "id,name,budget")
+        first = next(pages, None)
+        trips = {str(t["id"]): t for t in trips.result()}
+    return trips, itertools.chain([first], pages) if first else None
+
+def report_summary(trips, totals):
+    # totals maps trip id -> (expense count, total spent) for every trip with
+    # expenses in the selection, in the order they first appeared.
+    rows = []
+    for trip_id, (count, total) in totals.items():
+        budget = trips[trip_id]["budget"]
+        rows.append({"name": trips[trip_id]["name"], "budget": float(budget) if budget is not None else None,
+                     "count": count, "total": total,
+                     "remaining": float(budget) - total if budget is not None else None})
+    return rows
+
+def report_period(date_range):
+    start, end = date_range
+    if not start and not end:
+        return "Period: All dates"
+    return f"Period: {start or 'start'} to {end or 'today'}"
+
+def sheet_title(name, used):
+    title = "".join("-" if ch in "[]:*?/\\" else ch for ch in str(name)).strip()[:31] or "Trip"
+    base, n = title, 2
+    while title.lower() in used:
+        suffix = f" ({n})"
+        title, n = base[:31 - len(suffix)] + suffix, n + 1
+    used.add(title.lower())
+    return title
+
+def write_report_summary(ws, summary, date_range):
+    for col, width in zip("ABCDE", REPORT_WIDTHS):
+        ws.column_dimensions[col].width = width
+    ws.row_dimensions[1].height = 30
+    ws.row_dimensions[5].height = 25
+    ws.merged_cells.add("A1:E1")
+    ws.append([excel_cell(ws, "EXPENSE REPORT", "title")])
+    ws.append([excel_cell(ws, report_period(date_range), "budget")])
+    ws.append([])
+    ws.append([])
+    ws.append([excel_cell(ws, h, "header") for h in REPORT_HEADERS])
+    for row in summary:
+        ws.append([excel_cell(ws, row["name"], "cell"), excel_cell(ws, row["budget"], "amount"),
+                   excel_cell(ws, row["count"], "cell"), excel_cell(ws, row["total"], "amount"),
+                   excel_cell(ws, row["remaining"], "amount")])
+    ws.append([])
+    ws.append([excel_cell(ws, "TOTAL:", "total_label"), None,
+               excel_cell(ws, sum(r["count"] for r in summary), "total_label"),
+               excel_cell(ws, sum(r["total"] for r in summary), "total")])
+    ws.append([])
+    ws.append([excel_cell(ws, f"Generated: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}", "footer")])
+
+def build_report_excel(trip_ids, date_range):
+    # Rows arrive ordered by time across trips; each run of rows goes straight
+    # to its trip's write-only sheet, so all sheets fill in a single pass.
+    # The summary sheet is created first (so it is the first tab) and written
+    # last, once the totals are known.
+    from openpyxl import Workbook
+    trips, pages = open_report(trip_ids, date_range)
+    if pages is None:
+        return None
+    wb = Workbook(write_only=True)
+    add_excel_styles(wb)
+    summary_ws = wb.create_sheet("Summary")
+    used = {"summary"}
+    sheets = {}
+    totals = {}
+    for rows in pages:
+        for trip_id, group in itertools.groupby(rows, key=lambda e: str(e["trip_id"])):
+            if trip_id not in trips:
+                continue
+            group = list(group)
+            if trip_id not in sheets:
+                sheets[trip_id] = start_trip_sheet(wb, trips[trip_id], sheet_title(trips[trip_id]["name"], used))
+            append_expense_rows(sheets[trip_id], group)
+            count, total = totals.get(trip_id, (0, 0.0))
+            totals[trip_id] = (count + len(group), total + sum(float(e["amount"]) for e in group))
+    if not sheets:
+        return None
+    for trip_id, ws in sheets.items():
+        finish_trip_sheet(ws, trips[trip_id], *totals[trip_id])
+    write_report_summary(summary_ws, report_summary(trips, totals), date_range)
+    output = BytesIO()
+    wb.save(output)
+    return f"Expense_Report_{datetime.now().strftime('%Y%m%d')}.xlsx", output.getvalue()
+
+def report_pdf_elements(summary, date_range, styles):
+    from reportlab.platypus import Table, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+    def money(value):
+        return f"Rs.{value:,.2f}" if value is not None else "-"
+    data = [list(REPORT_HEADERS)]
+    for row in summary:
+        data.append([row["name"], money(row["budget"]), row["count"], money(row["total"]), money(row["remaining"])])
+    data.append(["Total", "", sum(r["count"] for r in summary), money(sum(r["total"] for r in summary)), ""])
+    table = Table(data, colWidths=[2.3*inch, 1.2*inch, 0.9*inch, 1.1*inch, 1.1*inch])
+    table.setStyle(styles["table"])
+    return [Paragraph("Expense Report", styles["title"]),
+            Paragraph(report_period(date_range), getSampleStyleSheet()["Normal"]), Spacer(1, 20), table]
+
+def build_report_pdf(trip_ids, date_range):
+    from reportlab.platypus import PageBreak
+    trips, pages = open_report(trip_ids, date_range)
+    if pages is None:
+        return None
+    grouped = {}
+    for rows in pages:
+        for e in rows:
+            if str(e["trip_id"]) in trips:
+                grouped.setdefault(str(e["trip_id"]), []).append(e)
+    if not grouped:
+        return None
+    totals = {t: (len(rows), sum(float(e["amount"]) for e in rows)) for t, rows in grouped.items()}
+    styles = pdf_styles()
+    elements = report_pdf_elements(report_summary(trips, totals), date_range, styles)
+    for trip_id, rows in grouped.items():
+        elements.append(PageBreak())
+        elements.extend(trip_pdf_elements(trips[trip_id], [rows], totals[trip_id][1], styles))
+    return f"Expense_Report_{datetime.now().strftime('%Y%m%d')}.pdf", render_pdf(elements)
+
+REPORT_BUILDERS = {"xlsx": build_report_excel, "pdf": build_report_pdf}
+
+@app.route("/api/export", methods=["GET"])
+def export_report():
+    try:
+        trip_ids, date_range = report_selection()
+        fmt = request.args.get("format", "xlsx")
+        if fmt not in REPORT_BUILDERS:
+            raise ValueError(f"format must be one of {', '.join(REPORT_BUILDERS)}")
+        selection = f"{','.join(sorted(trip_ids, key=int))}:{date_range[0]}:{date_range[1]}"
+        key = "report-" + hashlib.sha1(selection.encode()).hexdigest()[:16]
+        return export_response(key, fmt, lambda _: REPORT_BUILDERS[fmt](trip_ids, date_range),
+                               scopes=[TRIPS_SCOPE, EXPENSES_SCOPE])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# STREAMING EXPORT
+STREAM_MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+def stream_csv(pages, columns):
+    fields = columns.split(",")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue()
+    for rows in pages:
         buffer.seek(0)
-        filename = f"{trip['name'].replace(' ','_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        return send_file(buffer, mimetype="application/pdf", as_attachment=True, download_name=filename)
+        buffer.truncate()
+        writer.writerows([row[f] for f in fields] for row in rows)
+        yield buffer.getvalue()
+
+def stream_ndjson(pages, columns):
+    for rows in pages:
+        yield "".join(json.dumps(row) + "\n" for row in rows)
+
+@app.route("/api/export/<trip_id>.<any(csv, ndjson):fmt>", methods=["GET"])
+def export_stream(trip_id, fmt):
+    # One chunk per Supabase page, so memory stays at one page however large
+    # the export; "all" streams every trip. The CSV header goes out before
+    # the first page is fetched.
+    try:
+        trip_id = None if trip_id == "all" else trip_id
+        scope = trip_scope(trip_id) if trip_id else EXPENSES_SCOPE
+        columns = select_fields(EXPENSE_STREAM_FIELDS, EXPENSE_COLUMNS)
+        etag = make_etag(scope)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        pages = prefetch(iter_expense_pages(get_db(), columns, trip_id, page_size=EXPENSE_MAX_PAGE_SIZE))
+        body = stream_csv(pages, columns) if fmt == "csv" else stream_ndjson(pages, columns)
+        response = Response(stream_with_context(body), mimetype=STREAM_MIMETYPES[fmt])
+        filename = f"expenses_{f'trip_{trip_id}' if trip_id else 'all'}_{datetime.now().strftime('%Y%m%d')}.{fmt}"
+        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+        return tag_response(response, etag)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# ANALYTICS SNAPSHOT
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+SNAPSHOT_STATE_FILE = "_snapshot.json"
+SNAPSHOT_OVERLAP = int(os.environ.get("SNAPSHOT_OVERLAP", 3600))
+SNAPSHOT_KINDS = {"budget": "money", "amount": "money", "date": "date", "time": "time", "created_at": "timestamp"}
+
+def snapshot_schemas(pa):
+    money = pa.decimal128(18, 2)
+    trips = pa.schema([("id", pa.int64()), ("name", pa.string()), ("budget", money), ("status", pa.string()),
+                       ("created_at", pa.timestamp("us"))])
+    expenses = pa.schema([("id", pa.int64()), ("trip_id", pa.int64()), ("date", pa.date32()), ("time", pa.time32("s")),
+                          ("category", pa.string()), ("amount", money), ("person", pa.string()),
+                          ("description", pa.string()), ("image", pa.string()), ("created_at", pa.timestamp("us"))])
+    return trips, expenses
+
+def snapshot_value(value, kind):
+    # date/time are stored as text, so anything unparseable becomes null
+    # rather than failing the whole snapshot.
+    if kind is None:
+        return value
+    if value is None or value == "":
+        return None
+    try:
+        if kind == "money":
+            return Decimal(str(value)).quantize(Decimal("0.01"), ROUND_HALF_UP)
+        if kind == "date":
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        if kind == "time":
+            return datetime.strptime(value, "%H:%M:%S").time()
+        return datetime.fromisoformat(value)
+    except (ValueError, TypeError, InvalidOperation):
+        return None
+
+def snapshot_rows(rows):
+    return [{k: snapshot_value(v, SNAPSHOT_KINDS.get(k)) for k, v in row.items()} for row in rows]
+
+def write_snapshot_file(pa, path, schema, fmt, batches, skip_empty=False):
+    # Written batch by batch to a hidden temp file and renamed into place,
+    # so readers never see a partial file. Returns the number of rows.
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    writer = None
+    rows = 0
+    def open_writer():
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(tmp, schema)
+        return pa.ipc.new_file(tmp, schema)
+    try:
+        for batch in batches:
+            writer = writer or open_writer()
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+            rows += len(batch)
+        if writer is None:
+            if skip_empty:
+                return 0
+            writer = open_writer()
+        writer.close()
+        writer = None
+        os.replace(tmp, path)
+        return rows
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# COMMANDS
+import click
+
+@app.cli.command("migrate-receipts")
+@click.option("--batch-size", default=100, show_default=True)
+@click.option("--force", is_flag=True, help="Migrate even if RECEIPT_DIR is a temporary directory.")
+def migrate_receipts(batch_size, force):
+    """Move inline base64 receipts out of the expenses table into the receipt store."""
+    if receipt_store_is_temporary() and not force:
+        # The migration replaces the only copy of each image with its hash.
+        raise click.ClickException(f"RECEIPT_DIR ({RECEIPT_DIR}) is a temporary directory; "
+                                   "set RECEIPT_DIR or RECEIPT_BACKEND=supabase, or pass --force")
+    db = get_db()
+    migrated = failed = 0
+    last_id = None
+    while True:
+        query = db.table("expenses").select("id,image").like("image", "data:%").order("id").limit(batch_size)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data
+        if not rows:
+            break
+        for row in rows:
+            try:
+                digest = store_receipt(row["image"])
+            except ValueError as e:
+                failed += 1
+                click.echo(f"Skipping expense {row['id']}: {e}", err=True)
+                continue
+            db.table("expenses").update({"image": digest}).eq("id", row["id"]).execute()
+            migrated += 1
+        last_id = rows[-1]["id"]
+    click.echo(f"Migrated {migrated} receipt(s), {failed} skipped")
+
+def rollup_drift(stored, actual):
+    # Describes every way a rollup differs from the totals computed from the
+    # expenses; the rollup keys a missing category or person as "".
+    if stored is None:
+        return [f"no rollup, actual {actual['total_spent']} ({actual['expense_count']} rows)"]
+    def close(a, b):
+        return abs(a - b) < 0.005
+    problems = []
+    if stored["expense_count"] != actual["expense_count"] or not close(stored["total_spent"], actual["total_spent"]):
+        problems.append(f"rollup {stored['total_spent']} ({stored['expense_count']} rows), "
+                        f"actual {actual['total_spent']} ({actual['expense_count']} rows)")
+    categories = {}
+    for k, v in actual["categories"].items():
+        categories[k or ""] = categories.get(k or "", 0) + v
+    for k in sorted(stored["categories"].keys() | categories.keys()):
+        a, b = stored["categories"].get(k), categories.get(k)
+        if a is None or b is None or not close(a, b):
+            problems.append(f"category {k!r}: rollup {a}, actual {b}")
+    for k in sorted(stored["persons"].keys() | actual["persons"].keys()):
+        a, b = stored["persons"].get(k), actual["persons"].get(k)
+        if a is None or b is None or a["count"] != b["count"] or not close(a["total"], b["total"]):
+            problems.append(f"person {k!r}: rollup {a and (a['total'], a['count'])}, actual {b and (b['total'], b['count'])}")
+    return problems
+
+@app.cli.command("check-rollups")
+@click.option("--trip", "trip_ids", multiple=True, help="Only check these trip ids.")
+@click.option("--repair", is_flag=True, help="Rebuild rollups that have drifted.")
+def check_rollups(trip_ids, repair):
+    """Compare trip_rollups against the expenses table and optionally rebuild drifted rows."""
+    db = get_db()
+    if not trip_ids:
+        trip_ids = [t["id"] for t in db.table("trips").select("id").order("id").execute().data]
+    rollups = fetch_rollups(db)
+    if rollups is None:
+        raise click.ClickException("trip_rollups is not available; apply supabase/migrations first")
+    rollups = {str(r["trip_id"]): r for r in rollups}
+    drifted = 0
+    for trip_id in trip_ids:
+        pages = iter_expense_pages(db, ",".join(EXPENSE_SUMMARY_FIELDS), trip_id)
+        actual = summarize_expenses(e for rows in pages for e in rows)
+        rollup = rollups.get(str(trip_id))
+        stored = rollup_totals(rollup) if rollup else None
+        problems = rollup_drift(stored, actual)
+        if not problems:
+            continue
+        drifted += 1
+        click.echo(f"Trip {trip_id}: " + "; ".join(problems))
+        if repair:
+            db.rpc("rebuild_trip_rollup", {"p_trip_id": trip_id}).execute()
+    click.echo(f"{drifted} of {len(trip_ids)} trip rollup(s) drifted" + (", rebuilt" if repair and drifted else ""))
+
+@app.cli.command("backfill-thumbnails")
+@click.option("--batch-size", default=500, show_default=True)
+def backfill_thumbnails(batch_size):
+    """Generate missing thumbnails for receipts already in the store."""
+    db = get_db()
+    store = get_receipt_store()
+    seen = set()
+    created = failed = 0
+    last_id = None
+    while True:
+        query = db.table("expenses").select("id,image").neq("image", "").order("id").limit(batch_size)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data
+        if not rows:
+            break
+        for row in rows:
+            digest = row["image"] or ""
+            if not RECEIPT_HASH_RE.match(digest) or digest in seen:
+                continue
+            seen.add(digest)
+            if store.get_thumbnail(digest) is not None:
+                continue
+            original = store.get(digest)
+            if original is None or save_thumbnail(digest, BytesIO(original)) is None:
+                failed += 1
+                click.echo(f"Could not thumbnail receipt {digest} (expense {row['id']})", err=True)
+                continue
+            created += 1
+        last_id = rows[-1]["id"]
+    click.echo(f"Created {created} thumbnail(s), {failed} failed")
+
+def cursor_key(row):
+    return datetime.fromisoformat(row["created_at"]), row["id"]
+
+def overlap_start(row, overlap):
+    start = datetime.fromisoformat(row["created_at"]) - timedelta(seconds=overlap)
+    return {"created_at": start.isoformat(), "id": 0}
+
+@app.cli.command("export-snapshot")
+@click.argument("out_dir", type=click.Path(file_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["parquet", "arrow"]), default="parquet", show_default=True)
+@click.option("--incremental", is_flag=True, help="Append only expenses created since the last snapshot in OUT_DIR.")
+@click.option("--batch-size", default=EXPENSE_MAX_PAGE_SIZE, show_default=True)
+@click.option("--overlap", default=SNAPSHOT_OVERLAP, show_default=True,
+              help="Seconds behind the saved cursor that --incremental re-reads for late commits.")
+def export_snapshot(out_dir, fmt, incremental, batch_size, overlap):
+    """Write trips and expenses to OUT_DIR as a typed Parquet or Arrow IPC snapshot.
+
+    trips.<ext> is rewritten on every run; expenses are a directory of part
+    files, one per run, readable as a single dataset. --incremental resumes
+    from the (created_at, id) cursor saved by the previous run. created_at is
+    stamped by the app before the insert commits, so a slow import or another
+    instance can commit rows that sort behind a saved cursor; each run
+    re-reads the last --overlap seconds before the cursor and skips the ids it
+    already exported there. Rows committed more than --overlap seconds after
+    their created_at, and edits and deletes of already exported expenses, are
+    only picked up by a full run.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise click.ClickException("export-snapshot needs pyarrow (pip install pyarrow)")
+    db = get_db()
+    trips_schema, expenses_schema = snapshot_schemas(pa)
+    ext = "parquet" if fmt == "parquet" else "arrow"
+    state_path = os.path.join(out_dir, SNAPSHOT_STATE_FILE)
+    parts_dir = os.path.join(out_dir, "expenses")
+    state = None
+    if incremental:
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            click.echo("No previous snapshot found, writing a full one", err=True)
+        if state and state["format"] != fmt:
+            raise click.ClickException(f"The snapshot in {out_dir} is {state['format']}; pass --format {state['format']}")
+    os.makedirs(parts_dir, exist_ok=True)
+    if state is None:
+        for name in os.listdir(parts_dir):
+            if name.startswith("part-"):
+                os.remove(os.path.join(parts_dir, name))
+    trips = db.table("trips").select(",".join(TRIP_COLUMNS)).order("id").execute().data
+    write_snapshot_file(pa, os.path.join(out_dir, f"trips.{ext}"), trips_schema, fmt, [snapshot_rows(trips)])
+    cursor = state["cursor"] if state else None
+    # recent holds (created_at, id) of every row exported after the window
+    # key, so the next run can re-read the overlap without writing them
+    # twice. Snapshots written before it existed only know their cursor.
+    recent = deque(tuple(r) for r in state.get("recent", [])) if state else deque()
+    seen = {row_id for _, row_id in recent}
+    window = state.get("window", cursor) if state else None
+    window = decode_cursor(window) if window else None
+    after = None
+    if cursor:
+        after = overlap_start(decode_cursor(cursor), overlap)
+        if window and cursor_key(window) > cursor_key(after):
+            after = window
+    pages = iter_expense_pages(db, ",".join(EXPENSE_COLUMNS), after=after, page_size=batch_size)
+    def batches():
+        nonlocal cursor, window
+        last = decode_cursor(cursor) if cursor else None
+        for rows in pages:
+            if last is None or cursor_key(rows[-1]) > cursor_key(last):
+                last = rows[-1]
+                cursor = encode_cursor(last)
+            fresh = [r for r in rows if r["id"] not in seen]
+            recent.extend((r["created_at"], r["id"]) for r in fresh)
+            start = overlap_start(last, overlap)
+            if window is None or cursor_key(start) > cursor_key(window):
+                window = start
+            while recent and cursor_key({"created_at": recent[0][0], "id": recent[0][1]}) <= cursor_key(window):
+                recent.popleft()
+            if fresh:
+                yield snapshot_rows(fresh)
+    part = os.path.join(parts_dir, f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.{ext}")
+    count = write_snapshot_file(pa, part, expenses_schema, fmt, batches(), skip_empty=state is not None)
+    state = {"format": fmt, "cursor": cursor, "rows": (state["rows"] if state else 0) + count,
+             "window": encode_cursor(window) if window else None, "recent": [list(r) for r in recent],
+             "updated_at": datetime.now().isoformat()}
+    with open(state_path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(state_path + ".tmp", state_path)
+    click.echo(f"Wrote {len(trips)} trip(s) and {count} {'new ' if incremental else ''}expense(s) to {out_dir}")
+
+@app.cli.command("purge-trash")
+@click.option("--older-than", default=TRASH_RETENTION, show_default=True, help="Seconds a trip stays in the trash.")
+def purge_trash_command(older_than):
+    """Permanently delete trashed trips, their expenses and unreferenced receipts."""
+    trips, receipts = purge_trash(get_db(), older_than)
+    click.echo(f"Purged {trips} trip(s), removed {receipts} receipt(s)")
+
 if __name__ == "__main__":
     print("Trip Expense Tracker Started!")
     app.run(host="0.0.0.0", debug=False, port=5000)
@@ -0,0 +1,427 @@
+"""Micro-benchmarks for the expense tracker's hot paths.
+
+Run ``python bench.py <name>`` (or ``python bench.py all``). Each benchmark
+works on synthetic data, so no Supabase project is needed.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import app
+
+CATEGORIES = ["Food", "Transport", "Accommodation", "Activities", "Shopping", "Fuel", "Other"]
+PEOPLE = ["Asha", "Ravi", "Meera", "Kabir"]
+SIZES = [100, 1000, 10000, 100000]
+
+
+def make_expenses(n, trip_id=1, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    rows = []
+    for i in range(n):
+        ts = start + timedelta(minutes=7 * i)
+        rows.append({
+            "id": i + 1,
+            "trip_id": trip_id,
+            "date": ts.strftime("%Y-%m-%d"),
+            "time": ts.strftime("%H:%M:%S"),
+            "category": rng.choice(CATEGORIES),
+            "amount": round(rng.uniform(20, 5000), 2),
+            "person": rng.choice(PEOPLE),
+            "description": "Lunch at the station cafe with the whole group" if i % 3 else "",
+            "image": "",
+            "created_at": ts.isoformat(),
+        })
+    return rows
+
+
+def best_of(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# SUMMARY
+def legacy_summary(payload):
+    trip_expenses = json.loads(payload)
+    total_spent = sum(float(e["amount"]) for e in trip_expenses)
+    categories = {}
+    for e in trip_expenses:
+        cat = e["category"]
+        categories[cat] = categories.get(cat, 0) + float(e["amount"])
+    return total_spent, categories
+
+
+def bench_summary(args):
+    print("Summary latency vs expense count (decode + aggregate, best of 5)")
+    print(f"{'expenses':>9} {'legacy ms':>10} {'single ms':>10} {'rpc ms':>8} {'legacy KB':>10} {'single KB':>10} {'rpc KB':>7}")
+    for n in args.sizes:
+        rows = make_expenses(n)
+        full = json.dumps(rows)
+        projected = json.dumps([{k: e[k] for k in app.EXPENSE_SUMMARY_FIELDS} for e in rows])
+        rpc = json.dumps(app.summarize_expenses(rows))
+        legacy_t = best_of(lambda: legacy_summary(full))
+        single_t = best_of(lambda: app.summarize_expenses(json.loads(projected)))
+        rpc_t = best_of(lambda: json.loads(rpc))
+        print(f"{n:>9} {legacy_t * 1000:>10.2f} {single_t * 1000:>10.2f} {rpc_t * 1000:>8.3f} "
+              f"{len(full) / 1024:>10.1f} {len(projected) / 1024:>10.1f} {len(rpc) / 1024:>7.2f}")
+
+
+# EXCEL
+def legacy_excel(trip, trip_expenses, total_spent):
+    # The pandas + per-cell restyling export this repo shipped before the
+    # write-only renderer, kept here as the baseline. pandas is no longer an
+    # app dependency; install it separately to run the excel benchmarks.
+    import pandas as pd
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    df = pd.DataFrame(trip_expenses)[["date","time","category","amount","person","description"]]
+    df.columns = ["Date","Time","Category","Amount","Person","Description"]
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name="Expenses", startrow=4)
+        ws = writer.sheets["Expenses"]
+        ws["A1"] = f"TRIP: {trip['name']}"
+        ws["A1"].font = Font(size=16, bold=True, color="FFFFFF")
+        ws["A1"].fill = PatternFill(start_color="667eea", end_color="667eea", fill_type="solid")
+        ws["A1"].alignment = Alignment(horizontal="left", vertical="center")
+        ws.merge_cells("A1:F1")
+        ws.row_dimensions[1].height = 30
+        ws["A2"] = f"Budget: Rs.{float(trip['budget']):,.2f}" if trip["budget"] else "Budget: Not Set"
+        ws["A2"].font = Font(size=11, bold=True)
+        hf = PatternFill(start_color="1e293b", end_color="1e293b", fill_type="solid")
+        border = Border(left=Side(style="thin",color="e2e8f0"),right=Side(style="thin",color="e2e8f0"),
+                       top=Side(style="thin",color="e2e8f0"),bottom=Side(style="thin",color="e2e8f0"))
+        for col in range(1, 7):
+            cell = ws.cell(row=5, column=col)
+            cell.fill = hf
+            cell.font = Font(bold=True, color="FFFFFF", size=11)
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+            cell.border = border
+        ws.row_dimensions[5].height = 25
+        for row in range(6, len(df) + 6):
+            for col in range(1, 7):
+                cell = ws.cell(row=row, column=col)
+                cell.border = border
+                if col == 4:
+                    cell.number_format = "#,##0.00"
+                    cell.alignment = Alignment(horizontal="right", vertical="center")
+                    cell.font = Font(bold=True)
+        for col, width in zip("ABCDEF", [12,10,20,15,18,40]):
+            ws.column_dimensions[col].width = width
+        last_row = len(df) + 7
+        sf = PatternFill(start_color="f8fafc", end_color="f8fafc", fill_type="solid")
+        tb = Border(left=Side(style="medium",color="1e293b"),right=Side(style="medium",color="1e293b"),
+                   top=Side(style="medium",color="1e293b"),bottom=Side(style="medium",color="1e293b"))
+        ws[f"D{last_row}"] = "TOTAL SPENT:"
+        ws[f"D{last_row}"].font = Font(bold=True, size=11)
+        ws[f"D{last_row}"].fill = sf
+        ws[f"D{last_row}"].border = tb
+        ws[f"D{last_row}"].alignment = Alignment(horizontal="right")
+        ws[f"E{last_row}"] = total_spent
+        ws[f"E{last_row}"].font = Font(bold=True, size=12)
+        ws[f"E{last_row}"].number_format = "#,##0.00"
+        ws[f"E{last_row}"].fill = sf
+        ws[f"E{last_row}"].border = tb
+        ws[f"E{last_row}"].alignment = Alignment(horizontal="right")
+        ws.row_dimensions[last_row].height = 25
+        if trip["budget"] is not None:
+            remaining = float(trip["budget"]) - total_spent
+            rc = "10b981" if remaining >= 0 else "ef4444"
+            ws[f"D{last_row+1}"] = "TRIP BUDGET:"
+            ws[f"D{last_row+1}"].font = Font(bold=True, size=11)
+            ws[f"D{last_row+1}"].fill = sf
+            ws[f"D{last_row+1}"].border = tb
+            ws[f"D{last_row+1}"].alignment = Alignment(horizontal="right")
+            ws[f"E{last_row+1}"] = float(trip["budget"])
+            ws[f"E{last_row+1}"].number_format = "#,##0.00"
+            ws[f"E{last_row+1}"].fill = sf
+            ws[f"E{last_row+1}"].border = tb
+            ws[f"E{last_row+1}"].alignment = Alignment(horizontal="right")
+            ws[f"D{last_row+2}"] = "REMAINING:"
+            ws[f"D{last_row+2}"].font = Font(bold=True, size=12, color="FFFFFF")
+            ws[f"D{last_row+2}"].fill = PatternFill(start_color=rc, end_color=rc, fill_type="solid")
+            ws[f"D{last_row+2}"].border = tb
+            ws[f"D{last_row+2}"].alignment = Alignment(horizontal="right")
+            ws[f"E{last_row+2}"] = remaining
+            ws[f"E{last_row+2}"].font = Font(bold=True, size=13, color="FFFFFF")
+            ws[f"E{last_row+2}"].number_format = "#,##0.00"
+            ws[f"E{last_row+2}"].fill = PatternFill(start_color=rc, end_color=rc, fill_type="solid")
+            ws[f"E{last_row+2}"].border = tb
+            ws[f"E{last_row+2}"].alignment = Alignment(horizontal="right")
+            ws.row_dimensions[last_row+1].height = 25
+            ws.row_dimensions[last_row+2].height = 30
+        footer_row = last_row + 4 if trip["budget"] else last_row + 2
+        ws[f"A{footer_row}"] = f"Generated: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}"
+        ws[f"A{footer_row}"].font = Font(size=9, italic=True, color="64748b")
+    output.seek(0)
+    return output
+
+
+def streaming_excel(trip, rows, total_spent, page_size=app.EXPENSE_MAX_PAGE_SIZE):
+    pages = (rows[i:i + page_size] for i in range(0, len(rows), page_size))
+    return app.render_excel(trip, pages, total_spent)
+
+
+EXCEL_RENDERERS = {"legacy": legacy_excel, "streaming": streaming_excel}
+
+
+def excel_inputs(n):
+    rows = [{k: e[k] for k in app.EXPENSE_EXPORT_FIELDS} for e in make_expenses(n)]
+    return {"name": "Goa Trip", "budget": 250000}, rows, sum(e["amount"] for e in rows)
+
+
+def peak_rss_kb():
+    # VmHWM belongs to this address space; ru_maxrss survives fork+exec on
+    # Linux and would report the benchmark parent's peak instead.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_rss_growth(renderers, inputs, renderer, n):
+    # Each run gets a fresh interpreter so the high-water mark reflects only
+    # that renderer; reported as growth over the peak before rendering (KB).
+    code = (f"import bench; args = bench.{inputs}({n}); before = bench.peak_rss_kb(); "
+            f"bench.{renderers}[{renderer!r}](*args); print(bench.peak_rss_kb() - before)")
+    out = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                         capture_output=True, text=True, check=True)
+    return int(out.stdout.split()[-1])
+
+
+def bench_excel(args):
+    print("Excel export throughput and peak memory (best of 3)")
+    print(f"{'expenses':>9} {'legacy rows/s':>14} {'stream rows/s':>14} {'legacy MB':>10} {'stream MB':>10}")
+    for n in args.sizes:
+        trip, rows, total = excel_inputs(n)
+        legacy_t = best_of(lambda: legacy_excel(trip, rows, total), repeat=3)
+        stream_t = best_of(lambda: streaming_excel(trip, rows, total), repeat=3)
+        legacy_rss = peak_rss_growth("EXCEL_RENDERERS", "excel_inputs", "legacy", n)
+        stream_rss = peak_rss_growth("EXCEL_RENDERERS", "excel_inputs", "streaming", n)
+        print(f"{n:>9} {n / legacy_t:>14,.0f} {n / stream_t:>14,.0f} "
+              f"{legacy_rss / 1024:>10.1f} {stream_rss / 1024:>10.1f}")
+
+
+# PDF
+def legacy_pdf(trip, trip_expenses, total_spent):
+    # The single-table PDF export this repo shipped before chunked tables.
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.lib.enums import TA_CENTER
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30)
+    elements = []
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle("T", parent=styles["Heading1"], fontSize=24,
+        textColor=colors.HexColor("#667eea"), spaceAfter=30, alignment=TA_CENTER, fontName="Helvetica-Bold")
+    elements.append(Paragraph(f"Trip: {trip['name']}", title_style))
+    elements.append(Spacer(1, 12))
+    budget_data = []
+    if trip["budget"]:
+        budget_data.append(["Trip Budget:", f"Rs.{float(trip['budget']):,.2f}"])
+    budget_data.append(["Total Spent:", f"Rs.{total_spent:,.2f}"])
+    if trip["budget"]:
+        budget_data.append(["Remaining:", f"Rs.{float(trip['budget']) - total_spent:,.2f}"])
+    bt = Table(budget_data, colWidths=[2*inch, 2*inch])
+    bt.setStyle(TableStyle([
+        ("BACKGROUND", (0,0), (-1,-1), colors.HexColor("#f8fafc")),
+        ("FONTNAME", (0,0), (-1,-1), "Helvetica-Bold"),
+        ("FONTSIZE", (0,0), (-1,-1), 12),
+        ("BOTTOMPADDING", (0,0), (-1,-1), 12),
+        ("TOPPADDING", (0,0), (-1,-1), 12),
+        ("GRID", (0,0), (-1,-1), 1, colors.HexColor("#e2e8f0"))
+    ]))
+    elements.append(bt)
+    elements.append(Spacer(1, 30))
+    data = [["Date","Category","Amount","Person","Description"]]
+    for e in trip_expenses:
+        desc = e.get("description") or "-"
+        data.append([e["date"], e["category"], f"Rs.{float(e['amount']):,.2f}",
+                    e.get("person") or "-", desc[:50] + "..." if len(desc) > 50 else desc])
+    table = Table(data, colWidths=[1*inch, 1.2*inch, 1*inch, 1*inch, 2.3*inch])
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#1e293b")),
+        ("TEXTCOLOR", (0,0), (-1,0), colors.whitesmoke),
+        ("ALIGN", (0,0), (-1,0), "CENTER"),
+        ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+        ("FONTSIZE", (0,0), (-1,0), 10),
+        ("BOTTOMPADDING", (0,0), (-1,0), 12),
+        ("BACKGROUND", (0,1), (-1,-1), colors.white),
+        ("FONTNAME", (0,1), (-1,-1), "Helvetica"),
+        ("FONTSIZE", (0,1), (-1,-1), 9),
+        ("TOPPADDING", (0,1), (-1,-1), 8),
+        ("BOTTOMPADDING", (0,1), (-1,-1), 8),
+        ("GRID", (0,0), (-1,-1), 0.5, colors.HexColor("#e2e8f0")),
+        ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.white, colors.HexColor("#f8fafc")])
+    ]))
+    elements.append(table)
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def chunked_pdf(trip, rows, total_spent):
+    pages = (rows[i:i + app.EXPENSE_MAX_PAGE_SIZE] for i in range(0, len(rows), app.EXPENSE_MAX_PAGE_SIZE))
+    return app.render_pdf(app.trip_pdf_elements(trip, pages, total_spent, app.pdf_styles()))
+
+
+PDF_RENDERERS = {"legacy": legacy_pdf, "chunked": chunked_pdf}
+
+
+def bench_pdf(args):
+    print("PDF export time and peak memory (best of 3)")
+    print(f"{'expenses':>9} {'legacy s':>9} {'chunked s':>10} {'legacy MB':>10} {'chunked MB':>11}")
+    for n in args.sizes:
+        trip, rows, total = excel_inputs(n)
+        legacy_t = best_of(lambda: legacy_pdf(trip, rows, total), repeat=3)
+        chunked_t = best_of(lambda: chunked_pdf(trip, rows, total), repeat=3)
+        legacy_rss = peak_rss_growth("PDF_RENDERERS", "excel_inputs", "legacy", n)
+        chunked_rss = peak_rss_growth("PDF_RENDERERS", "excel_inputs", "chunked", n)
+        print(f"{n:>9} {legacy_t:>9.2f} {chunked_t:>10.2f} {legacy_rss / 1024:>10.1f} {chunked_rss / 1024:>11.1f}")
+
+
+def excel_snapshot(output):
+    # Everything a reader of the workbook can see: values and full cell
+    # styles, row heights, column widths and merged ranges. The footer
+    # timestamp is the only value expected to differ between two runs.
+    from openpyxl import load_workbook
+
+    def color(c):
+        # Only the attribute named by type is meaningful; the others hold
+        # openpyxl descriptors.
+        return (c.type, c.value, c.tint) if c is not None else None
+
+    def side(s):
+        return (s.style, color(s.color)) if s is not None and s.style else None
+
+    ws = load_workbook(output).active
+    cells = {}
+    for row in ws.iter_rows():
+        for c in row:
+            if c.value is None and not c.has_style:
+                continue
+            value = "Generated: <timestamp>" if str(c.value).startswith("Generated: ") else c.value
+            f, a, b = c.font, c.alignment, c.border
+            cells[c.coordinate] = (
+                value, c.number_format,
+                (f.name, f.sz, f.b, f.i, f.u, color(f.color)),
+                (c.fill.fill_type, color(c.fill.fgColor) if c.fill.fill_type else None),
+                (a.horizontal, a.vertical, a.wrap_text),
+                tuple(side(x) for x in (b.left, b.right, b.top, b.bottom)),
+            )
+    heights = {k: v.height for k, v in ws.row_dimensions.items() if v.height}
+    widths = {k: v.width for k, v in ws.column_dimensions.items()}
+    return ws.title, cells, heights, widths, sorted(str(r) for r in ws.merged_cells.ranges)
+
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "excel_golden.json")
+GOLDEN_BUDGETS = (250000, 1000, 0, None)
+GOLDEN_SIZES = (1, 12)
+GOLDEN_PAGE_SIZE = 5
+
+
+def golden_cases():
+    for budget in GOLDEN_BUDGETS:
+        for n in GOLDEN_SIZES:
+            trip, rows, total = excel_inputs(n)
+            trip["budget"] = budget
+            yield f"budget={budget} expenses={n}", (trip, rows, total)
+
+
+def normalize_snapshot(snapshot):
+    # JSON has no tuples and only string keys; compare in that form.
+    return json.loads(json.dumps(snapshot))
+
+
+def bench_excel_golden(args):
+    if args.regenerate:
+        # The fixture is the legacy pandas export's snapshot; only
+        # regenerating it needs pandas installed.
+        golden = {name: normalize_snapshot(excel_snapshot(legacy_excel(*inputs))) for name, inputs in golden_cases()}
+        os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+        with open(GOLDEN_PATH, "w") as f:
+            json.dump(golden, f, sort_keys=True, separators=(",", ":"))
+            f.write("\n")
+        print(f"Wrote {len(golden)} golden snapshot(s) to {os.path.relpath(GOLDEN_PATH)}")
+        return
+    print(f"Excel golden check: streaming export vs {os.path.relpath(GOLDEN_PATH)}")
+    with open(GOLDEN_PATH) as f:
+        golden = json.load(f)
+    failures = 0
+    for name, inputs in golden_cases():
+        expected = golden.get(name)
+        actual = normalize_snapshot(excel_snapshot(streaming_excel(*inputs, page_size=GOLDEN_PAGE_SIZE)))
+        ok = expected == actual
+        failures += not ok
+        detail = ""
+        if expected is None:
+            detail = " (not in fixture, run with --regenerate)"
+        elif not ok:
+            diff = sorted(k for k in expected[1].keys() | actual[1].keys() if expected[1].get(k) != actual[1].get(k))
+            detail = f" first differing cell: {diff[0] if diff else 'sheet layout'}"
+        print(f"  {name:<28} {'ok' if ok else 'MISMATCH'}{detail}")
+    if failures:
+        sys.exit(1)
+
+
+def startup_cost(code):
+    # Wall time and peak RSS of a fresh interpreter running code (ms, KB).
+    script = ("import time; t = time.perf_counter(); " + code + "; import bench; "
+              "print((time.perf_counter() - t) * 1000, bench.peak_rss_kb())")
+    out = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                         capture_output=True, text=True, check=True)
+    elapsed, rss = out.stdout.split()[-2:]
+    return float(elapsed), int(rss)
+
+
+def bench_startup(args):
+    print("Cold-start cost in a fresh interpreter (best of 5 wall time, peak RSS)")
+    steps = {
+        "import app": "import app",
+        "import app + pandas": "import app, pandas",
+        "first export (streaming)": "import app, bench; bench.streaming_excel(*bench.excel_inputs(100))",
+        "first export (legacy)": "import app, bench; bench.legacy_excel(*bench.excel_inputs(100))",
+    }
+    print(f"{'step':<26} {'ms':>8} {'MB':>8}")
+    for label, code in steps.items():
+        runs = [startup_cost(code) for _ in range(5)]
+        print(f"{label:<26} {min(r[0] for r in runs):>8.1f} {max(r[1] for r in runs) / 1024:>8.1f}")
+
+
+BENCHMARKS = {
+    "summary": bench_summary,
+    "excel": bench_excel,
+    "excel-golden": bench_excel_golden,
+    "pdf": bench_pdf,
+    "startup": bench_startup,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("name", choices=sorted(BENCHMARKS) + ["all"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--regenerate", action="store_true",
+                        help="excel-golden: rewrite the fixture from the legacy export (needs pandas)")
+    args = parser.parse_args()
+    for name, bench in BENCHMARKS.items():
+        if args.name in (name, "all"):
+            bench(args)
+            print()
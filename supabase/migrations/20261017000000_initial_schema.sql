@@ -0,0 +1,23 @@
+-- Tables used by app.py, as they exist in the Supabase project.
+create table if not exists trips (
+  id bigint generated by default as identity primary key,
+  name text not null,
+  budget numeric,
+  status text not null default 'ongoing',
+  created_at timestamp not null default now()
+);
+
+create table if not exists expenses (
+  id bigint generated by default as identity primary key,
+  trip_id bigint not null references trips (id),
+  category text,
+  amount numeric not null,
+  description text default '',
+  person text default '',
+  image text default '',
+  date text,
+  time text,
+  created_at timestamp not null default now()
+);
+
+create index if not exists expenses_trip_id_created_at_idx on expenses (trip_id, created_at, id);
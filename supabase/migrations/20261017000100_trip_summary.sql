@@ -0,0 +1,20 @@
+-- Totals and per-category breakdown for one trip, computed in the database so
+-- GET /api/trips/<id>/summary transfers a handful of numbers regardless of
+-- how many expenses the trip has.
+create or replace function trip_summary(p_trip_id bigint)
+returns json
+language sql
+stable
+as $$
+  select json_build_object(
+    'total_spent', coalesce(sum(total), 0),
+    'expense_count', coalesce(sum(n), 0),
+    'categories', coalesce(json_object_agg(coalesce(category, ''), total), '{}'::json)
+  )
+  from (
+    select category, sum(amount) as total, count(*) as n
+    from expenses
+    where trip_id = p_trip_id
+    group by category
+  ) per_category;
+$$;
@@ -0,0 +1,122 @@
+-- Per-trip running totals maintained by triggers on expenses, so summary,
+-- export and trip-list reads are a single-row lookup. categories and persons
+-- map a key to {"total": numeric, "count": integer}.
+create table if not exists trip_rollups (
+  trip_id bigint primary key references trips (id) on delete cascade,
+  total numeric not null default 0,
+  expense_count integer not null default 0,
+  categories jsonb not null default '{}',
+  persons jsonb not null default '{}',
+  updated_at timestamp not null default now()
+);
+
+create or replace function rollup_bump(doc jsonb, key text, amount numeric, n integer)
+returns jsonb
+language sql
+immutable
+as $$
+  select case
+    when coalesce((doc -> key ->> 'count')::integer, 0) + n <= 0 then doc - key
+    else doc || jsonb_build_object(key, jsonb_build_object(
+      'total', coalesce((doc -> key ->> 'total')::numeric, 0) + amount,
+      'count', coalesce((doc -> key ->> 'count')::integer, 0) + n))
+  end;
+$$;
+
+create or replace function apply_expense_to_rollup(p_trip_id bigint, p_category text, p_person text, p_amount numeric, p_count integer)
+returns void
+language sql
+as $$
+  insert into trip_rollups as r (trip_id, total, expense_count, categories, persons)
+  select p_trip_id, p_amount, p_count,
+         rollup_bump('{}', coalesce(p_category, ''), p_amount, p_count),
+         rollup_bump('{}', coalesce(p_person, ''), p_amount, p_count)
+  where exists (select 1 from trips where id = p_trip_id)
+  on conflict (trip_id) do update set
+    total = r.total + p_amount,
+    expense_count = r.expense_count + p_count,
+    categories = rollup_bump(r.categories, coalesce(p_category, ''), p_amount, p_count),
+    persons = rollup_bump(r.persons, coalesce(p_person, ''), p_amount, p_count),
+    updated_at = now();
+$$;
+
+create or replace function expenses_rollup_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op in ('DELETE', 'UPDATE') then
+    perform apply_expense_to_rollup(old.trip_id, old.category, old.person, -old.amount, -1);
+  end if;
+  if tg_op in ('INSERT', 'UPDATE') then
+    perform apply_expense_to_rollup(new.trip_id, new.category, new.person, new.amount, 1);
+  end if;
+  return null;
+end;
+$$;
+
+drop trigger if exists expenses_rollup on expenses;
+create trigger expenses_rollup
+  after insert or update or delete on expenses
+  for each row execute function expenses_rollup_trigger();
+
+create or replace function trips_rollup_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+  insert into trip_rollups (trip_id) values (new.id) on conflict (trip_id) do nothing;
+  return null;
+end;
+$$;
+
+drop trigger if exists trips_rollup on trips;
+create trigger trips_rollup
+  after insert on trips
+  for each row execute function trips_rollup_trigger();
+
+create or replace function rebuild_trip_rollup(p_trip_id bigint)
+returns void
+language sql
+as $$
+  insert into trip_rollups as r (trip_id, total, expense_count, categories, persons)
+  select t.id,
+         coalesce((select sum(amount) from expenses where trip_id = t.id), 0),
+         (select count(*) from expenses where trip_id = t.id),
+         coalesce((select jsonb_object_agg(k, jsonb_build_object('total', total, 'count', n))
+                   from (select coalesce(category, '') as k, sum(amount) as total, count(*) as n
+                         from expenses where trip_id = t.id group by 1) c), '{}'),
+         coalesce((select jsonb_object_agg(k, jsonb_build_object('total', total, 'count', n))
+                   from (select coalesce(person, '') as k, sum(amount) as total, count(*) as n
+                         from expenses where trip_id = t.id group by 1) p), '{}')
+  from trips t
+  where t.id = p_trip_id
+  on conflict (trip_id) do update set
+    total = excluded.total,
+    expense_count = excluded.expense_count,
+    categories = excluded.categories,
+    persons = excluded.persons,
+    updated_at = now();
+$$;
+
+select rebuild_trip_rollup(id) from trips;
+
+-- The RPC fallback reports per-person sums too, in the same shape as the rollup.
+create or replace function trip_summary(p_trip_id bigint)
+returns json
+language sql
+stable
+as $$
+  select json_build_object(
+    'total_spent', coalesce(sum(amount), 0),
+    'expense_count', count(*),
+    'categories', coalesce((select json_object_agg(k, total)
+                            from (select coalesce(category, '') as k, sum(amount) as total
+                                  from expenses where trip_id = p_trip_id group by 1) c), '{}'::json),
+    'persons', coalesce((select json_object_agg(k, json_build_object('total', total, 'count', n))
+                         from (select coalesce(person, '') as k, sum(amount) as total, count(*) as n
+                               from expenses where trip_id = p_trip_id group by 1) p), '{}'::json)
+  )
+  from expenses
+  where trip_id = p_trip_id;
+$$;
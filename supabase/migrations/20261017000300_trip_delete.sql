@@ -0,0 +1,36 @@
+-- Atomic trip deletion and a trash (soft-delete) state for trips.
+-- Deleting a trip row now removes its expenses (and, via trip_rollups'
+-- own cascade, its rollup) in the same statement.
+alter table expenses drop constraint if exists expenses_trip_id_fkey;
+alter table expenses
+  add constraint expenses_trip_id_fkey foreign key (trip_id) references trips (id) on delete cascade;
+
+-- Trashed trips keep their rows until the purge sweep deletes them.
+alter table trips add column if not exists deleted_at timestamp;
+create index if not exists trips_deleted_at_idx on trips (deleted_at) where deleted_at is not null;
+
+-- Receipts are content-addressed and may be shared between expenses, so
+-- deleting one has to check for remaining references.
+create index if not exists expenses_image_idx on expenses (image) where image <> '';
+
+-- Deletes the trip and everything hanging off it in one transaction and
+-- returns the receipt hashes no remaining expense refers to, for the caller
+-- to remove from the receipt store. Returns null if the trip did not exist.
+create or replace function delete_trip(p_trip_id bigint)
+returns text[]
+language plpgsql
+as $$
+declare
+  images text[];
+begin
+  select coalesce(array_agg(distinct image), '{}') into images
+    from expenses
+   where trip_id = p_trip_id and image ~ '^[0-9a-f]{64}$';
+  delete from trips where id = p_trip_id;
+  if not found then
+    return null;
+  end if;
+  return coalesce((select array_agg(i) from unnest(images) as i
+                    where not exists (select 1 from expenses e where e.image = i)), '{}');
+end;
+$$;
@@ -0,0 +1,101 @@
+-- Version counters behind the API's ETags and read-cache keys. They live in
+-- the database and are bumped by triggers, so every app instance sees every
+-- write, including writes made by another instance or outside the app.
+-- Scopes: 'trips' (trip list), 'expenses' (unfiltered expense list) and
+-- 'trip:<id>' for everything about one trip.
+create table if not exists data_versions (
+  scope text primary key,
+  version bigint not null default 0
+);
+
+create or replace function bump_data_versions(p_scopes text[])
+returns void
+language sql
+as $$
+  insert into data_versions as v (scope, version)
+  select distinct s, 1 from unnest(p_scopes) as s
+  on conflict (scope) do update set version = v.version + 1;
+$$;
+
+-- Statement-level, so a bulk write bumps each scope once however many rows
+-- it touches. Only the transition tables of the firing event exist; plpgsql
+-- plans the other branches lazily, so they are never resolved.
+create or replace function expenses_version_trigger()
+returns trigger
+language plpgsql
+as $$
+declare
+  scopes text[];
+begin
+  if tg_op = 'INSERT' then
+    select array_agg(distinct 'trip:' || trip_id) into scopes from new_rows;
+  elsif tg_op = 'DELETE' then
+    select array_agg(distinct 'trip:' || trip_id) into scopes from old_rows;
+  else
+    select array_agg(distinct 'trip:' || trip_id) into scopes
+      from (select trip_id from old_rows union select trip_id from new_rows) t;
+  end if;
+  if scopes is not null then
+    perform bump_data_versions(array['trips', 'expenses'] || scopes);
+  end if;
+  return null;
+end;
+$$;
+
+drop trigger if exists expenses_version_insert on expenses;
+create trigger expenses_version_insert
+  after insert on expenses
+  referencing new table as new_rows
+  for each statement execute function expenses_version_trigger();
+
+drop trigger if exists expenses_version_update on expenses;
+create trigger expenses_version_update
+  after update on expenses
+  referencing old table as old_rows new table as new_rows
+  for each statement execute function expenses_version_trigger();
+
+drop trigger if exists expenses_version_delete on expenses;
+create trigger expenses_version_delete
+  after delete on expenses
+  referencing old table as old_rows
+  for each statement execute function expenses_version_trigger();
+
+create or replace function trips_version_trigger()
+returns trigger
+language plpgsql
+as $$
+declare
+  scopes text[];
+begin
+  if tg_op = 'INSERT' then
+    select array_agg('trip:' || id) into scopes from new_rows;
+  elsif tg_op = 'DELETE' then
+    select array_agg('trip:' || id) into scopes from old_rows;
+  else
+    select array_agg(distinct 'trip:' || id) into scopes
+      from (select id from old_rows union select id from new_rows) t;
+  end if;
+  if scopes is not null then
+    perform bump_data_versions(array['trips'] || scopes);
+  end if;
+  return null;
+end;
+$$;
+
+drop trigger if exists trips_version_insert on trips;
+create trigger trips_version_insert
+  after insert on trips
+  referencing new table as new_rows
+  for each statement execute function trips_version_trigger();
+
+drop trigger if exists trips_version_update on trips;
+create trigger trips_version_update
+  after update on trips
+  referencing old table as old_rows new table as new_rows
+  for each statement execute function trips_version_trigger();
+
+drop trigger if exists trips_version_delete on trips;
+create trigger trips_version_delete
+  after delete on trips
+  referencing old table as old_rows
+  for each statement execute function trips_version_trigger();
@@ -0,0 +1,106 @@
+-- Maintain trip_rollups once per statement instead of once per row. The
+-- row-level trigger upserted the same trip_rollups row twice for every
+-- updated expense, so a bulk edit of 200 rows did 400 upserts on one row;
+-- now every statement folds its rows into one delta per trip.
+do $$
+begin
+  create type rollup_change as (trip_id bigint, category text, person text, amount numeric, n integer);
+exception when duplicate_object then
+  null;
+end;
+$$;
+
+-- Adds a delta document ({"key": {"total", "count"}}) into a rollup
+-- document, dropping keys whose count reaches zero like rollup_bump does.
+create or replace function rollup_merge(doc jsonb, delta jsonb)
+returns jsonb
+language sql
+immutable
+as $$
+  select coalesce(jsonb_object_agg(k, v), '{}')
+  from (
+    select coalesce(d.key, c.key) as k,
+           jsonb_build_object(
+             'total', coalesce((d.value ->> 'total')::numeric, 0) + coalesce((c.value ->> 'total')::numeric, 0),
+             'count', coalesce((d.value ->> 'count')::integer, 0) + coalesce((c.value ->> 'count')::integer, 0)) as v
+    from jsonb_each(doc) d
+    full join jsonb_each(delta) c on c.key = d.key
+  ) merged
+  where (v ->> 'count')::integer > 0;
+$$;
+
+create or replace function apply_rollup_changes(p_changes rollup_change[])
+returns void
+language sql
+as $$
+  insert into trip_rollups (trip_id)
+  select distinct c.trip_id from unnest(p_changes) c
+  where exists (select 1 from trips where id = c.trip_id)
+  on conflict (trip_id) do nothing;
+
+  update trip_rollups r set
+    total = r.total + d.amount,
+    expense_count = r.expense_count + d.n,
+    categories = rollup_merge(r.categories, d.categories),
+    persons = rollup_merge(r.persons, d.persons),
+    updated_at = now()
+  from (
+    select t.trip_id, t.amount, t.n, coalesce(cat.doc, '{}') as categories, coalesce(per.doc, '{}') as persons
+    from (select trip_id, sum(amount) as amount, sum(n)::integer as n
+          from unnest(p_changes) group by trip_id) t
+    left join (select trip_id, jsonb_object_agg(k, jsonb_build_object('total', total, 'count', n)) as doc
+               from (select trip_id, coalesce(category, '') as k, sum(amount) as total, sum(n) as n
+                     from unnest(p_changes) group by 1, 2) g
+               group by trip_id) cat using (trip_id)
+    left join (select trip_id, jsonb_object_agg(k, jsonb_build_object('total', total, 'count', n)) as doc
+               from (select trip_id, coalesce(person, '') as k, sum(amount) as total, sum(n) as n
+                     from unnest(p_changes) group by 1, 2) g
+               group by trip_id) per using (trip_id)
+  ) d
+  where r.trip_id = d.trip_id;
+$$;
+
+-- Only the transition tables of the firing event exist; plpgsql plans the
+-- other branches lazily, so they are never resolved.
+create or replace function expenses_rollup_statement_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op = 'INSERT' then
+    perform apply_rollup_changes(array(
+      select row(trip_id, category, person, amount, 1)::rollup_change from new_rows));
+  elsif tg_op = 'DELETE' then
+    perform apply_rollup_changes(array(
+      select row(trip_id, category, person, -amount, -1)::rollup_change from old_rows));
+  else
+    perform apply_rollup_changes(array(
+      select row(trip_id, category, person, -amount, -1)::rollup_change from old_rows
+      union all
+      select row(trip_id, category, person, amount, 1)::rollup_change from new_rows));
+  end if;
+  return null;
+end;
+$$;
+
+drop trigger if exists expenses_rollup on expenses;
+
+drop trigger if exists expenses_rollup_insert on expenses;
+create trigger expenses_rollup_insert
+  after insert on expenses
+  referencing new table as new_rows
+  for each statement execute function expenses_rollup_statement_trigger();
+
+drop trigger if exists expenses_rollup_update on expenses;
+create trigger expenses_rollup_update
+  after update on expenses
+  referencing old table as old_rows new table as new_rows
+  for each statement execute function expenses_rollup_statement_trigger();
+
+drop trigger if exists expenses_rollup_delete on expenses;
+create trigger expenses_rollup_delete
+  after delete on expenses
+  referencing old table as old_rows
+  for each statement execute function expenses_rollup_statement_trigger();
+
+drop function if exists expenses_rollup_trigger();